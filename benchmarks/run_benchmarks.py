@@ -0,0 +1,172 @@
+import argparse
+import fnmatch
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+for folder in ('q1_solution', 'q3_solution', 'creating_a_basic_model'):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+from synthetic import iter_synthetic_ticks, synthetic_bars, synthetic_ticks
+
+# Times every stage of the Python pipelines on seeded synthetic data and records its peak memory.
+# Each stage runs `repeat` times untraced (best time is kept) and once more under tracemalloc for the peak
+# bytes it allocated on top of what was already live (numpy and pandas buffers are traced too).
+# Results are compared against baseline.json: a stage that is slower than baseline * (1 + time_tolerance)
+# or needs more than baseline * (1 + memory_tolerance) bytes is a regression and the run exits with status 1.
+# Timings are machine specific, regenerate the baseline with --update-baseline on the machine that compares.
+# A change that intentionally moves a stage's time or memory commits the regenerated baseline with it, otherwise
+# the old numbers hide later regressions (a stage that got 15x leaner would let a 15x regression pass).
+# --update-baseline only rewrites the entries it measured, so limit it with --suite / --stage to the stages the
+# change moves: re-recording the others only folds run to run noise into the reference.
+#
+#   python run_benchmarks.py                          # 1e4, 1e5, 1e6 rows against baseline.json
+#   python run_benchmarks.py --sizes 1e7 1e8 --suite ticks --repeat 1
+#   python run_benchmarks.py --suite bars --stage 'q1._prepare_data' --update-baseline
+
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+DEFAULT_SIZES = ['1e4', '1e5', '1e6']
+STREAM_CHUNK = 1_000_000
+
+def bar_stages(n, seed):
+    from q1 import MeanReversionBacktester
+    from indicators import CACHE
+    from momentum_bollinger_pairTrading import INITIAL_CAPITAL, backtest_strategy, sma_crossover
+
+    bars = synthetic_bars(n, seed=seed)
+    prepared = MeanReversionBacktester(bars)
+    tested = MeanReversionBacktester(prepared.data, prepared=True)
+    tested.run()
+    closes = bars[['close']].rename(columns={'close': 'Close'})
+
+    def crossover():
+        CACHE.clear() # every repeat computes its indicators
+        return sma_crossover(closes)
+
+    signals = crossover()
+    return [
+        ('synthetic_bars', lambda: synthetic_bars(n, seed=seed)),
+        ('q1._prepare_data', lambda: MeanReversionBacktester(bars)),
+        ('q1.run', lambda: MeanReversionBacktester(prepared.data, prepared=True).run()),
+        ('q1.evaluate_performance', lambda: tested.evaluate_performance(plot=False, verbose=False)),
+        ('sma_crossover', crossover),
+        ('backtest_strategy', lambda: backtest_strategy(signals, INITIAL_CAPITAL)),
+    ]
+
+def tick_stages(n, seed):
+    from q3 import add_labels, add_tick_features, resample_features, stream_features
+
+    stages = [('q3.stream_features', lambda: add_labels(stream_features(iter_synthetic_ticks(n, STREAM_CHUNK, seed))))]
+    if n > 10 * STREAM_CHUNK:
+        return stages # the in-memory path would hold every tick, only the streamed build runs at this size
+    ticks = synthetic_ticks(n, seed=seed)
+    features = add_tick_features(ticks.copy())
+    return [
+        ('synthetic_ticks', lambda: synthetic_ticks(n, seed=seed)),
+        ('q3.add_tick_features', lambda: add_tick_features(ticks.copy())),
+        ('q3.resample_features', lambda: resample_features(features)),
+    ] + stages
+
+SUITES = {'bars': bar_stages, 'ticks': tick_stages}
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return best, peak
+
+def run(suites, sizes, repeat, seed, stages=None):
+    # stages: optional fnmatch patterns of the stage names to measure, the others are skipped
+    results = []
+    for suite in suites:
+        for n in sizes:
+            for stage, func in SUITES[suite](n, seed):
+                if stages and not any(fnmatch.fnmatchcase(stage, pattern) for pattern in stages):
+                    continue
+                seconds, peak = measure(func, repeat)
+                results.append({'suite': suite, 'rows': n, 'stage': stage, 'seconds': seconds, 'peak_bytes': peak})
+                print(f"{suite:6s} {n:>12,} {stage:28s} {seconds:10.4f}s {peak / 2**20:10.1f} MiB", flush=True)
+    return results
+
+def result_key(result):
+    return f"{result['suite']}/{result['stage']}/{result['rows']}"
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    # list of human readable regressions, stages missing from the baseline are reported but never fail
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        reference = baseline.get(key)
+        if reference is None:
+            print(f"no baseline for {key}")
+            continue
+        if result['seconds'] > reference['seconds'] * (1 + time_tolerance):
+            regressions.append(
+                f"{key}: {result['seconds']:.4f}s vs baseline {reference['seconds']:.4f}s "
+                f"({result['seconds'] / reference['seconds']:.2f}x)"
+            )
+        if result['peak_bytes'] > reference['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append(
+                f"{key}: peak {result['peak_bytes'] / 2**20:.1f} MiB vs baseline "
+                f"{reference['peak_bytes'] / 2**20:.1f} MiB ({result['peak_bytes'] / reference['peak_bytes']:.2f}x)"
+            )
+    return regressions
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path, results, baseline):
+    baseline = dict(baseline)
+    baseline.update({result_key(r): {'seconds': r['seconds'], 'peak_bytes': r['peak_bytes']} for r in results})
+    with open(path, 'w') as f:
+        json.dump(dict(sorted(baseline.items())), f, indent=1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', choices=sorted(SUITES), action='append', help='default: all suites')
+    parser.add_argument('--stage', action='append', help="stage name or pattern, e.g. 'q3.*', default: all stages")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='row counts, 1e4 .. 1e8')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--time-tolerance', type=float, default=0.5)
+    parser.add_argument('--memory-tolerance', type=float, default=0.2)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='write the raw results as JSON')
+    args = parser.parse_args()
+
+    sizes = [int(float(size)) for size in args.sizes]
+    results = run(args.suite or sorted(SUITES), sizes, args.repeat, args.seed, args.stage)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        save_baseline(args.baseline, results, baseline)
+        print(f"baseline written to {args.baseline}")
+        sys.exit(0)
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nno regressions")
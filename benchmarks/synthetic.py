@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic market data for the benchmarks.
+# synthetic_bars generalises the example at the bottom of q1.py: the same sinusoid plus drift plus noise,
+# stretched so that `period` bars always hold `drift` of drift and `cycles` oscillations. With the defaults,
+# n=1560 and seed=123 it reproduces the q1 example frame exactly (same legacy RandomState call order).
+# synthetic_ticks produces bid/ask/trade ticks in the schema q3 reads from ethusdt_ticks.csv. Ticks are
+# generated chunk by chunk so 1e8 rows can be streamed (iter_synthetic_ticks) without holding them all.
+
+TICK_COLUMNS = ['bid_price', 'ask_price', 'bid_size', 'ask_size', 'side', 'trade_size']
+
+def synthetic_bars(n, seed=123, start="2025-01-01 09:30", freq="1min", period=1560, drift=2.0, cycles=10):
+    rng = np.random.RandomState(seed)
+    minutes = pd.date_range(start, periods=n, freq=freq)
+    stretch = (n - 1) / (period - 1) # 1.0 exactly when n == period
+    base = 100 + np.linspace(0, drift * stretch, n)
+    oscillation = 2 * np.sin(np.linspace(0, 2 * cycles * np.pi * stretch, n))
+    price = base + oscillation + rng.normal(0, 0.2, n)
+
+    open_ = np.empty(n)
+    open_[1:] = price[:-1]
+    open_[:1] = price[:1]
+    data = pd.DataFrame(index=minutes)
+    data['close'] = price
+    data['open'] = open_
+    data['high'] = np.maximum(open_, price) + np.abs(rng.normal(0, 0.05, size=n))
+    data['low'] = np.minimum(open_, price) - np.abs(rng.normal(0, 0.05, size=n))
+    data['volume'] = rng.randint(100, 1000, size=n)
+    return data
+
+def iter_synthetic_ticks(n, chunksize=1_000_000, seed=0, start="2024-01-01", mean_gap=0.08, mid=2000.0):
+    # yields tick frames indexed by timestamp like q3.read_tick_chunks, the same (n, chunksize, seed)
+    # always gives the same ticks
+    rng = np.random.default_rng(seed)
+    clock = pd.Timestamp(start).value
+    side_codes = np.array([0, 1], dtype=np.int8)
+    for lo in range(0, n, chunksize):
+        size = min(chunksize, n - lo)
+        gaps = (rng.exponential(mean_gap, size) * 1e9).astype(np.int64)
+        gaps[rng.random(size) < 0.0005] = 90 * 10**9 # occasional quiet minutes
+        stamps = clock + np.cumsum(gaps)
+        clock = int(stamps[-1])
+        mids = mid + np.cumsum(rng.normal(0, 0.05, size))
+        mid = float(mids[-1])
+        spread = np.round(rng.uniform(0.01, 0.2, size), 2)
+        side = pd.Categorical.from_codes(rng.choice(side_codes, size), categories=['buy', 'sell'])
+        yield pd.DataFrame({
+            'bid_price': np.round(mids - spread / 2, 2),
+            'ask_price': np.round(mids + spread / 2, 2),
+            'bid_size': rng.exponential(5, size),
+            'ask_size': rng.exponential(5, size),
+            'side': side,
+            'trade_size': rng.exponential(0.3, size),
+        }, index=pd.DatetimeIndex(stamps.view('datetime64[ns]'), name='timestamp'))
+
+def synthetic_ticks(n, seed=0, chunksize=1_000_000, **kwargs):
+    return pd.concat(iter_synthetic_ticks(n, chunksize=chunksize, seed=seed, **kwargs))
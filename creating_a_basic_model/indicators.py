@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Shared rolling indicators for the strategy functions.
+# sma_crossover(short=20), bollinger_strategy(window=20) and friends all need the same rolling statistics
+# over Close, so they ask this cache instead of recomputing them. An entry is keyed by
+# (series identity, indicator, window, min_periods) where the series identity is the address/shape/strides of
+# its values buffer. Every entry keeps a reference to that buffer, so the address cannot be reused by another
+# array while the entry is alive. Series are treated as immutable: writing into a cached Close in place is
+# not detected. Results are handed out as read-only Series over the cached array (no copy) and the least
+# recently used entries are evicted once max_bytes is exceeded.
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+def _series_key(values):
+    interface = values.__array_interface__
+    return interface['data'][0], values.shape, values.strides, values.dtype.str
+
+class IndicatorCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (source values, result values)
+        self.nbytes = 0 # counts both the results and the source buffers the entries keep alive
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, series, indicator, window, compute, min_periods=None):
+        # compute(series) is only called on a miss, its result is stored read-only
+        source = series.to_numpy()
+        key = (_series_key(source), indicator, window, min_periods)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            values = entry[1]
+        else:
+            self.misses += 1
+            values = np.asarray(compute(series), dtype=np.float64)
+            if values is source or np.shares_memory(values, source):
+                values = values.copy()
+            values.flags.writeable = False
+            self.entries[key] = (source, values)
+            self.nbytes += values.nbytes + source.nbytes
+            self._evict()
+        return pd.Series(values, index=series.index, name=series.name, copy=False)
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, (source, values) = self.entries.popitem(last=False)
+            self.nbytes -= values.nbytes + source.nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+CACHE = IndicatorCache()
+
+def rolling_mean(series, window, min_periods=None, cache=None):
+    cache = CACHE if cache is None else cache
+    return cache.get(
+        series, 'mean', window, lambda s: s.rolling(window, min_periods=min_periods).mean(), min_periods
+    )
+
+def rolling_std(series, window, min_periods=None, cache=None):
+    cache = CACHE if cache is None else cache
+    return cache.get(
+        series, 'std', window, lambda s: s.rolling(window, min_periods=min_periods).std(), min_periods
+    )
+
+def pct_change(series, periods, cache=None):
+    cache = CACHE if cache is None else cache
+    return cache.get(series, 'pct_change', periods, lambda s: s.pct_change(periods))
@@ -1,22 +1,21 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime
+from indicators import pct_change, rolling_mean, rolling_std
+from portfolio_engine import build_portfolio, checkpoint_portfolio
+from price_cache import load_prices
 
 START_DATE = "2023-01-01" #limited the date for better visualization
 END_DATE = datetime.date.today().strftime("%Y-%m-%d") #bascially extracting today's date.
 INITIAL_CAPITAL = 10000.0 # fixing basic capital as for pair trading, as sometimes it needs sufficient capital. 
 
-def get_stock_data(ticker, start, end):
+def get_stock_data(ticker, start=START_DATE, end=END_DATE):
     try: # this is to handle exceptions when a wrong ticker is being used
-        data = yf.download(ticker, start=startingdate, end=enddate, auto_adjust=True) # ticker is scraped off of yfinance within the time bound stated and auto adjust is used to smoothe out things like stock splits 
-        if data.empty:
+        data = load_prices(ticker, start, end) # read from the local price cache, only the dates it does not have yet are downloaded from yfinance
+        if data is None or data.empty:
             print(f"No data found for {ticker} in the specified date range.") # prints the ticker entered is wrong 
             return None
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = [col[0] for col in data.columns] # when you download the data it is usually in the form ('Close','TICKER') so we flatten it to just 'Close'
-        print(f"Successfully downloaded data for {ticker}.") 
+        print(f"Successfully loaded data for {ticker}.") 
         # print("Downloaded data columns:", data.columns.tolist())
         return data
     except Exception as e: # this is for error handling 
@@ -24,9 +23,9 @@ def get_stock_data(ticker, start, end):
         return None
 
 def sma_crossover(data, short=20, long=50):
-    data = data.copy() # make a copy of the data that we got in the previous function 
-    data['SMA_Short'] = data['Close'].rolling(window=short).mean() # 
-    data['SMA_Long'] = data['Close'].rolling(window=long).mean()
+    data = data.copy(deep=False) # new columns go on the copy, the input's own columns are never written
+    data['SMA_Short'] = rolling_mean(data['Close'], short) # shared with every other strategy on this Close, see indicators.py
+    data['SMA_Long'] = rolling_mean(data['Close'], long)
     data.dropna(inplace=True)
     data['Signal'] = 0
     data.loc[data['SMA_Short'] > data['SMA_Long'], 'Signal'] = 1
@@ -35,8 +34,8 @@ def sma_crossover(data, short=20, long=50):
     return data
 
 def momentum_strategy(data, lookback=10):
-    data = data.copy()
-    data['Momentum'] = data['Close'].pct_change(lookback)
+    data = data.copy(deep=False)
+    data['Momentum'] = pct_change(data['Close'], lookback)
     data.dropna(inplace=True)
     data['Signal'] = 0
     data.loc[data['Momentum'] > 0, 'Signal'] = 1
@@ -45,9 +44,9 @@ def momentum_strategy(data, lookback=10):
     return data
 
 def bollinger_strategy(data, window=20, num_std=2):
-    data = data.copy()
-    data['MA'] = data['Close'].rolling(window).mean()
-    data['STD'] = data['Close'].rolling(window).std()
+    data = data.copy(deep=False)
+    data['MA'] = rolling_mean(data['Close'], window)
+    data['STD'] = rolling_std(data['Close'], window)
     data['Upper'] = data['MA'] + num_std * data['STD']
     data['Lower'] = data['MA'] - num_std * data['STD']
     data.dropna(inplace=True)
@@ -57,15 +56,15 @@ def bollinger_strategy(data, window=20, num_std=2):
     data['Position'] = data['Signal'].diff().fillna(0)
     return data
 
-def pair_trading_strategy(stock1, stock2, z_thresh=1.0):
+def pair_trading_strategy(stock1, stock2, z_thresh=1.0, hedge_ratio=1.0):
     data = pd.DataFrame({
         'A': stock1['Close'],
         'B': stock2['Close']
     }).dropna()
 
-    data['Spread'] = data['A'] - data['B']
-    mean = data['Spread'].rolling(20).mean()
-    std = data['Spread'].rolling(20).std()
+    data['Spread'] = data['A'] - hedge_ratio * data['B'] # hedge_ratio B shares per A share, pair_scanner.py estimates it
+    mean = rolling_mean(data['Spread'], 20)
+    std = rolling_std(data['Spread'], 20)
     data['Z'] = (data['Spread'] - mean) / std
 
     data['Signal'] = 0
@@ -76,56 +75,32 @@ def pair_trading_strategy(stock1, stock2, z_thresh=1.0):
     data['Close'] = data['A']  
     return data
 
-def backtest_strategy(data, initial_capital):
-    data = data.copy()
-    portfolio = pd.DataFrame(index=data.index)
-    portfolio['Holdings'] = 0.0
-    portfolio['Cash'] = initial_capital
-    portfolio['Total'] = initial_capital
-
-    for i in range(1, len(data)):
-        today = data.index[i]
-        yesterday = data.index[i - 1]
-        price = data['Close'].iloc[i]
-        signal = data['Position'].iloc[i]
-
-        portfolio.loc[today, 'Cash'] = portfolio.loc[yesterday, 'Cash']
-        portfolio.loc[today, 'Holdings'] = portfolio.loc[yesterday, 'Holdings']
-
-        if signal == 1 and portfolio.loc[today, 'Holdings'] == 0:
-            shares = portfolio.loc[today, 'Cash'] // price
-            cost = shares * price
-            portfolio.loc[today, 'Cash'] -= cost
-            portfolio.loc[today, 'Holdings'] = shares
-
-        elif signal == -1 and portfolio.loc[today, 'Holdings'] > 0:
-            shares = portfolio.loc[today, 'Holdings']
-            revenue = shares * price
-            portfolio.loc[today, 'Cash'] += revenue
-            portfolio.loc[today, 'Holdings'] = 0
-
-        portfolio.loc[today, 'Total'] = portfolio.loc[today, 'Cash'] + \
-                                        portfolio.loc[today, 'Holdings'] * price
-
-    portfolio['Daily_Return'] = portfolio['Total'].pct_change()
-    portfolio['Cumulative_Return'] = (1 + portfolio['Daily_Return']).cumprod()
-    portfolio['Cumulative_Return'].iat[0] = 1
-    return portfolio
-
-def calculate_metrics(portfolio):
-    daily = portfolio['Daily_Return'].dropna()
-    sharpe = np.sqrt(252) * daily.mean() / daily.std()
-    cumulative = (1 + daily).cumprod()
-    peak = cumulative.cummax()
-    drawdown = (cumulative - peak) / peak
+def backtest_strategy(data, initial_capital, instrument=None, resume_from=None):
+    # resume_from: portfolio_engine.checkpoint_portfolio state of the run over the bars before data
+    return build_portfolio(data, initial_capital, instrument, resume_from)
+
+def calculate_metrics(portfolio, resume_from=None):
+    # resume_from: the state backtest_strategy continued, the metrics then cover the bars before portfolio too
+    if resume_from is None:
+        daily = portfolio['Daily_Return'].dropna()
+        sharpe = np.sqrt(252) * daily.mean() / daily.std()
+        cumulative = (1 + daily).cumprod()
+        peak = cumulative.cummax()
+        max_drawdown = ((cumulative - peak) / peak).min()
+    else:
+        state = checkpoint_portfolio(portfolio, resume_from)
+        count, mean, m2 = state['returns']
+        sharpe = np.sqrt(252) * mean / np.sqrt(m2 / (count - 1)) if count > 1 else np.nan
+        max_drawdown = state['max_drawdown']
     return {
         "Sharpe Ratio": round(sharpe, 2),
-        "Max Drawdown (%)": round(drawdown.min() * 100, 2),
+        "Max Drawdown (%)": round(max_drawdown * 100, 2),
         "Final Value": round(portfolio['Total'].iloc[-1], 2),
         "Total Return (%)": round((portfolio['Cumulative_Return'].iloc[-1] - 1) * 100, 2)
     }
 
 def plot_strategy(data, portfolio, strategy_name):
+    import matplotlib.pyplot as plt # only needed for plotting, importing the module stays light
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True)
     ax1.plot(data['Close'], label='Close Price', alpha=0.7)
     if 'SMA_Short' in data.columns:
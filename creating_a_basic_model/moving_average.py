@@ -1,25 +1,24 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime
+from indicators import rolling_mean
+from portfolio_engine import build_portfolio
+from price_cache import load_prices
 
 startingdate = "2020-01-31"    # Start date for historical data, setting this date so that the data doesn't get big 
 enddate = datetime.date.today().strftime("%Y-%m-%d") # end date is today 
-shortsmaperiod = int(input("Enter the Short SMA period ") or 20) # Short SMA period, default is 20
-longsmaperiod = int(input("Enter the Long SMA period ") or 50) # Long SMA period, default is 50
-startingcaptial = int(input("Enter the Starting Capital in USD ") or 10000) # Starting capital for backtesting, default is 10,000 USD
+shortsmaperiod = 20 # Short SMA period, asked for when run as a script
+longsmaperiod = 50 # Long SMA period, asked for when run as a script
+startingcaptial = 10000 # Starting capital for backtesting in USD, asked for when run as a script
 tickerforsp500 = "^GSPC" 
 
 def get_stock_data(ticker, start, end):
     try: # this is to handle exceptions when a wrong ticker is being used
-        data = yf.download(ticker, start=startingdate, end=enddate, auto_adjust=True) # ticker is scraped off of yfinance within the time bound stated and auto adjust is used to smoothe out things like stock splits 
-        if data.empty:
+        data = load_prices(ticker, start, end) # read from the local price cache, only the dates it does not have yet are downloaded from yfinance
+        if data is None or data.empty:
             print(f"No data found for {ticker} in the specified date range.") # prints the ticker entered is wrong 
             return None
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = [col[0] for col in data.columns] # when you download the data it is usually in the form ('Close','TICKER') so we flatten it to just 'Close'
-        print(f"Successfully downloaded data for {ticker}.") 
+        print(f"Successfully loaded data for {ticker}.") 
         # print("Downloaded data columns:", data.columns.tolist())
         return data
     except Exception as e: # this is for error handling 
@@ -27,9 +26,9 @@ def get_stock_data(ticker, start, end):
         return None
 
 def apply_sma_crossover_strategy(data, short_window, long_window):
-    data1 = data.copy(deep=True)  # making a copy of the data to apply sma
-    data1['SMA_Short'] = data1['Close'].rolling(window=shortsmaperiod, min_periods=1).mean() #takes the close price for all the data frames and applies a rolling window of the duration of the period and takes the mean
-    data1['SMA_Long'] = data1['Close'].rolling(window=longsmaperiod, min_periods=1).mean()
+    data1 = data.copy(deep=False)  # shallow copy, the sma columns are added to the copy only
+    data1['SMA_Short'] = rolling_mean(data1['Close'], short_window, min_periods=1) #takes the close price for all the data frames and applies a rolling window of the duration of the period and takes the mean, cached in indicators.py
+    data1['SMA_Long'] = rolling_mean(data1['Close'], long_window, min_periods=1)
     if 'SMA_Short' in data1.columns and 'SMA_Long' in data1.columns:
         data1 = data1.dropna(subset=['SMA_Short', 'SMA_Long']).copy()
     else:
@@ -42,41 +41,14 @@ def apply_sma_crossover_strategy(data, short_window, long_window):
     print(f"Short SMA = {short_window} and Long SMA = {long_window}")
     return data1
 
-def backtest_strategy(data1, startingcaptial, ticker_symbol):
+def backtest_strategy(data1, startingcaptial, ticker_symbol, instrument=None, resume_from=None):
     if 'Position' not in data1.columns:
         print("Error: Strategy not applied. 'Position' column missing.")
         return None
-    portfolio = pd.DataFrame(index=data1.index) # Create a DataFrame to hold portfolio values
-    portfolio['Holdings'] = 0.0
-    portfolio['Cash'] = startingcaptial # Initialize cash with starting capital
-    portfolio['Total'] = startingcaptial   # Initialize total portfolio value with starting capital
     if data1.empty:
         print("Empty strategy DataFrame provided for backtesting.")
         return None
-    # Iterate through the DataFrame to simulate trades
-    for i in range(1, len(data1)):
-        today = data1.index[i]
-        yesterday = data1.index[i-1]
-        portfolio.loc[today, 'Cash'] = portfolio.loc[yesterday, 'Cash'] #loc is used to access row and column by label
-        portfolio.loc[today, 'Holdings'] = portfolio.loc[yesterday, 'Holdings'] #transfer holdings from yesterday to today
-        price = data1['Close'].iloc[i]
-        signal = data1['Position'].iloc[i]
-        if signal == 1 and portfolio.loc[today, 'Holdings'] == 0: #signal == 1 means buy signal and holdings is 0 means no shares are held
-            shares = portfolio.loc[today, 'Cash'] // price #buy as many shares as possible with available cash, you can tweak this to make a sort of safety net 
-            if shares > 0: # check if shares is greater than 0
-                cost = shares * price # calculate cost of shares
-                portfolio.loc[today, 'Holdings'] = shares # update holdings with number of shares bought
-                portfolio.loc[today, 'Cash'] -= cost # deduct cost from cash
-        elif signal == -1 and portfolio.loc[today, 'Holdings'] > 0:
-            # Sell all held shares
-            shares = portfolio.loc[today, 'Holdings']
-            revenue = shares * price
-            portfolio.loc[today, 'Cash'] += revenue
-            portfolio.loc[today, 'Holdings'] = 0
-        portfolio.loc[today, 'Total'] = portfolio.loc[today, 'Cash'] + portfolio.loc[today, 'Holdings'] * price
-    portfolio['Daily_Return'] = portfolio['Total'].pct_change()
-    portfolio['Cumulative_Return'] = (1 + portfolio['Daily_Return']).cumprod()
-    portfolio['Cumulative_Return'].iat[0] = 1 # Set initial cumulative return to 1 (100%) to aviod propagation of 0
+    portfolio = build_portfolio(data1, startingcaptial, instrument, resume_from) # simulates the trades on numpy arrays, see portfolio_engine.py
     final_value = portfolio['Total'].iloc[-1] # total value on last data frame 
     total_return = (portfolio['Cumulative_Return'].iloc[-1] - 1) * 100 # returns as percentage 
     print(f"\n--- Backtest Summary for {ticker_symbol} ---")
@@ -97,6 +69,7 @@ def plot_strategy(data1, portfolio, ticker_symbol, sp500_cumulative_returns=None
     if data1.empty or portfolio.empty: # no plot for empty data frame 
         print("Empty data: Cannot plot.")
         return
+    import matplotlib.pyplot as plt # only needed for plotting, importing the module stays light
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10), sharex=True) # this creates two plots within the same graph 
     ax1.plot(data1['Close'], label='Close Price', alpha=0.7) # in plot one there is close price for the underlying that is mapped
     ax1.plot(data1['SMA_Short'], label=f'SMA {shortsmaperiod}', color='orange') # plot for short sma 
@@ -132,6 +105,9 @@ def plot_strategy(data1, portfolio, ticker_symbol, sp500_cumulative_returns=None
     plt.show()
 
 if __name__ == "__main__":
+    shortsmaperiod = int(input("Enter the Short SMA period ") or 20) # Short SMA period, default is 20
+    longsmaperiod = int(input("Enter the Long SMA period ") or 50) # Long SMA period, default is 50
+    startingcaptial = int(input("Enter the Starting Capital in USD ") or 10000) # Starting capital for backtesting, default is 10,000 USD
     TICKER = input("Enter the Stock Ticker: ").strip().upper() or 'AAPL'
     print (f"\n")
     data = get_stock_data(TICKER, startingdate, enddate)
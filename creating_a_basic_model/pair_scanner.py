@@ -0,0 +1,109 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from momentum_bollinger_pairTrading import (
+    INITIAL_CAPITAL, backtest_strategy, calculate_metrics, pair_trading_strategy
+)
+
+# Screens a whole universe for pair trading candidates instead of the hard-wired AAPL/MSFT pair.
+# Every pair statistic can be written in terms of column means and the (co)variance matrices of returns and
+# prices, so they come from matrix products over blocks of tickers rather than a Python loop over ~125k pairs:
+#   correlation   corr of daily returns
+#   hedge_ratio   OLS beta of A on B prices, cov(A, B) / var(B)
+#   spread        A - beta * B, mean = mean(A) - beta * mean(B), std = std(A) * sqrt(1 - price_corr^2)
+#   zscore        latest spread against that mean/std
+# Blocks are independent and numpy releases the GIL inside the products, so they run on a thread pool.
+
+def load_universe(tickers, start, end):
+    # (time x ticker) close matrix from the local price cache, tickers without data are left out
+    from price_cache import load_prices
+    closes = {}
+    for ticker in tickers:
+        data = load_prices(ticker, start, end)
+        if data is not None and not data.empty:
+            closes[ticker] = data['Close']
+    return pd.DataFrame(closes)
+
+def clean_prices(prices, min_history=0.9):
+    # keeps tickers with at least min_history of the dates, then the dates every kept ticker has
+    prices = prices.loc[:, prices.notna().mean() >= min_history]
+    return prices.ffill().dropna()
+
+def _block_pairs(block, returns_z, prices_c, prices_std, prices_mean, last, min_corr):
+    (i0, i1), (j0, j1) = block
+    corr = returns_z[:, i0:i1].T @ returns_z[:, j0:j1] / (len(returns_z) - 1)
+    cov = prices_c[:, i0:i1].T @ prices_c[:, j0:j1] / (len(prices_c) - 1)
+    a, b = np.nonzero(corr >= min_corr)
+    a_idx = a + i0
+    b_idx = b + j0
+    keep = a_idx < b_idx # each unordered pair once, no self pairs
+    a, b, a_idx, b_idx = a[keep], b[keep], a_idx[keep], b_idx[keep]
+
+    var_b = prices_std[b_idx] ** 2
+    pair_cov = cov[a, b]
+    hedge = pair_cov / var_b
+    price_corr = pair_cov / (prices_std[a_idx] * prices_std[b_idx])
+    spread_mean = prices_mean[a_idx] - hedge * prices_mean[b_idx]
+    spread_std = prices_std[a_idx] * np.sqrt(np.clip(1 - price_corr ** 2, 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (last[a_idx] - hedge * last[b_idx] - spread_mean) / spread_std
+    return a_idx, b_idx, corr[a, b], price_corr, hedge, spread_mean, spread_std, zscore
+
+def scan_pairs(prices, min_corr=0.7, block_size=256, n_jobs=None, rank_by='correlation'):
+    # prices: (time x ticker) closes without gaps (see clean_prices), returns one row per pair
+    # with correlation >= min_corr, best candidates first
+    tickers = np.asarray(prices.columns)
+    values = prices.to_numpy(dtype=np.float64)
+    returns = values[1:] / values[:-1] - 1
+    returns_z = (returns - returns.mean(axis=0)) / returns.std(axis=0, ddof=1)
+    prices_mean = values.mean(axis=0)
+    prices_c = values - prices_mean
+    prices_std = values.std(axis=0, ddof=1)
+    last = values[-1]
+
+    edges = [(start, min(start + block_size, len(tickers))) for start in range(0, len(tickers), block_size)]
+    blocks = [(edges[i], edges[j]) for i in range(len(edges)) for j in range(i, len(edges))]
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as pool:
+        parts = list(pool.map(
+            lambda block: _block_pairs(block, returns_z, prices_c, prices_std, prices_mean, last, min_corr), blocks
+        ))
+
+    columns = ['correlation', 'price_correlation', 'hedge_ratio', 'spread_mean', 'spread_std', 'zscore']
+    a_idx, b_idx, *stats = (np.concatenate(part) for part in zip(*parts))
+    pairs = pd.DataFrame(dict(zip(columns, stats)))
+    pairs.insert(0, 'A', tickers[a_idx])
+    pairs.insert(1, 'B', tickers[b_idx])
+    key = pairs['zscore'].abs() if rank_by == 'zscore' else pairs[rank_by]
+    return pairs.loc[key.sort_values(ascending=False).index].reset_index(drop=True)
+
+def backtest_top_pairs(prices, pairs, top_n=10, z_thresh=1.0, initial_capital=INITIAL_CAPITAL):
+    # runs the existing pair strategy and backtest on the top_n pairs with their scanned hedge ratios
+    results = {}
+    for row in pairs.head(top_n).itertuples(index=False):
+        stock1 = prices[[row.A]].rename(columns={row.A: 'Close'})
+        stock2 = prices[[row.B]].rename(columns={row.B: 'Close'})
+        pair_data = pair_trading_strategy(stock1, stock2, z_thresh=z_thresh, hedge_ratio=row.hedge_ratio)
+        portfolio = backtest_strategy(pair_data, initial_capital)
+        results[f"{row.A}-{row.B}"] = dict(calculate_metrics(portfolio), correlation=row.correlation, hedge_ratio=row.hedge_ratio)
+    return pd.DataFrame.from_dict(results, orient='index')
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(7)
+    n_days, n_tickers, n_factors = 750, 500, 20
+    factors = rng.normal(0, 0.01, (n_days, n_factors))
+    loadings = rng.normal(0, 1, (n_factors, n_tickers)) * (rng.random((n_factors, n_tickers)) < 0.1)
+    returns = factors @ loadings + rng.normal(0, 0.005, (n_days, n_tickers))
+    prices = pd.DataFrame(
+        100 * np.exp(np.cumsum(returns, axis=0)),
+        index=pd.bdate_range("2022-01-03", periods=n_days), columns=[f"T{i:03d}" for i in range(n_tickers)]
+    )
+    start = time.perf_counter()
+    pairs = scan_pairs(prices, min_corr=0.5)
+    print(f"scanned {n_tickers * (n_tickers - 1) // 2:,} pairs in {time.perf_counter() - start:.2f}s, {len(pairs):,} above threshold")
+    print(pairs.head(10).to_string(index=False))
+    print(backtest_top_pairs(prices, pairs, top_n=5).to_string())
@@ -0,0 +1,144 @@
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+# Array based replacement for the row by row .loc loop in backtest_strategy.
+# The all-in/all-out state machine only changes state on bars where Position is non zero,
+# so we walk those bars only and fill everything in between with numpy.
+# A run can be checkpointed (checkpoint_portfolio) and continued on the bars appended after it
+# (build_portfolio(..., resume_from=state)): the cash, shares, last total and cumulative return carry over,
+# so the new rows cost time proportional to their count and equal the same rows of a full rerun exactly.
+# The state also carries the running peak and max drawdown of the cumulative return and the count, mean and
+# sum of squared deviations of the daily returns, so calculate_metrics(portfolio, resume_from=state) covers the
+# whole history from the new rows alone (Sharpe merges the moments, so it agrees with a full rerun to rounding).
+
+def run_all_in_portfolio(close, position, initial_capital, start=None):
+    # start=(cash, shares) continues a previous run, whose next bar can trade right away
+    close = np.asarray(close, dtype=np.float64)
+    position = np.asarray(position, dtype=np.float64)
+    n = len(close)
+    cur_cash, cur_shares = (float(initial_capital), 0.0) if start is None else (float(start[0]), float(start[1]))
+    holdings = np.full(n, cur_shares) # shares held at the end of each bar
+    cash = np.full(n, cur_cash) # cash at the end of each bar
+    if n == 0:
+        return holdings, cash, cash.copy()
+
+    if start is None:
+        events = np.flatnonzero(position[1:] != 0) + 1 # the loop starts at bar 1, so bar 0 can never trade
+    else:
+        events = np.flatnonzero(position != 0)
+    change_at = [] # bars where holdings/cash change
+    held_after = []
+    cash_after = []
+    for i in events:
+        signal = position[i]
+        price = close[i]
+        if signal == 1 and cur_shares == 0: # buy only when flat
+            shares = cur_cash // price
+            if not shares > 0: # nothing can be bought, stay flat
+                continue
+            cur_cash -= shares * price
+            cur_shares = shares
+        elif signal == -1 and cur_shares > 0: # sell only when long
+            cur_cash += cur_shares * price
+            cur_shares = 0.0
+        else:
+            continue
+        change_at.append(i)
+        held_after.append(cur_shares)
+        cash_after.append(cur_cash)
+
+    if change_at:
+        # every bar carries the state of the last trade at or before it
+        segment = np.searchsorted(change_at, np.arange(n), side='right') - 1
+        traded = segment >= 0
+        holdings[traded] = np.asarray(held_after)[segment[traded]]
+        cash[traded] = np.asarray(cash_after)[segment[traded]]
+
+    total = cash + holdings * close
+    if start is None:
+        total[0] = initial_capital # bar 0 is never marked to market in the original loop
+    return holdings, cash, total
+
+def build_portfolio(data, initial_capital, instrument=None, resume_from=None):
+    # instrument is an optional q1_solution/instrumentation.Instrument, timed as the backtest_strategy stage.
+    # resume_from is a checkpoint_portfolio state, data then holds the bars after it and the result only those rows
+    with nullcontext() if instrument is None else instrument.stage('backtest_strategy', data):
+        return _build_portfolio(data, initial_capital, resume_from)
+
+def _build_portfolio(data, initial_capital, resume_from=None):
+    if resume_from is not None and len(data) and data.index[0] <= resume_from['end']:
+        raise ValueError(f"resumed bars must start after {resume_from['end']}, got {data.index[0]}")
+    holdings, cash, total = run_all_in_portfolio(
+        data['Close'].to_numpy(), data['Position'].to_numpy(), initial_capital,
+        None if resume_from is None else (resume_from['cash'], resume_from['shares'])
+    )
+    portfolio = pd.DataFrame(index=data.index)
+    portfolio['Holdings'] = holdings
+    portfolio['Cash'] = cash
+    portfolio['Total'] = total
+    portfolio['Daily_Return'] = portfolio['Total'].pct_change()
+    if resume_from is None:
+        cumulative = (1 + portfolio['Daily_Return']).cumprod()
+        if len(cumulative):
+            cumulative.iloc[0] = 1 # Set initial cumulative return to 1 to avoid propagation of NaN
+    else:
+        if len(portfolio):
+            portfolio.iloc[0, portfolio.columns.get_loc('Daily_Return')] = total[0] / resume_from['total'] - 1
+        growth = 1 + portfolio['Daily_Return'].to_numpy()
+        cumulative = np.cumprod(np.concatenate([[resume_from['cumulative']], growth]))[1:]
+    portfolio['Cumulative_Return'] = cumulative
+    return portfolio
+
+def checkpoint_portfolio(portfolio, resume_from=None):
+    # end of run state of a build_portfolio result, resume_from is the state that run continued (if any)
+    if portfolio.empty:
+        if resume_from is None:
+            raise ValueError("an empty portfolio has nothing to continue from")
+        return dict(resume_from)
+    return {
+        'end': portfolio.index[-1],
+        'cash': portfolio['Cash'].iloc[-1],
+        'shares': portfolio['Holdings'].iloc[-1],
+        'total': portfolio['Total'].iloc[-1],
+        'cumulative': portfolio['Cumulative_Return'].iloc[-1],
+        **_return_stats(portfolio, resume_from),
+    }
+
+def _return_stats(portfolio, resume_from=None):
+    # drawdown and daily return moments of the bars with a return (bar 0 of a fresh run has none), merged
+    # with the ones resume_from carries
+    returned = portfolio['Daily_Return'].notna().to_numpy()
+    daily = portfolio['Daily_Return'].to_numpy()[returned]
+    cumulative = portfolio['Cumulative_Return'].to_numpy()[returned]
+    peak, max_drawdown = -np.inf, 0.0
+    count, mean, m2 = 0, 0.0, 0.0
+    if resume_from is not None:
+        peak, max_drawdown = resume_from['peak'], resume_from['max_drawdown']
+        count, mean, m2 = resume_from['returns']
+    if len(daily):
+        peaks = np.maximum.accumulate(np.concatenate([[peak], cumulative]))[1:]
+        max_drawdown = min(max_drawdown, ((cumulative - peaks) / peaks).min())
+        peak = peaks[-1]
+        # Chan et al. pairwise update of the mean and the sum of squared deviations
+        new_mean = daily.mean()
+        new_m2 = ((daily - new_mean) ** 2).sum()
+        delta = new_mean - mean
+        total = count + len(daily)
+        mean += delta * len(daily) / total
+        m2 += new_m2 + delta ** 2 * count * len(daily) / total
+        count = total
+    return {'peak': peak, 'max_drawdown': max_drawdown, 'returns': (count, mean, m2)}
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    signal = np.where(pd.Series(close).rolling(20).mean() < pd.Series(close).rolling(50).mean(), 0, 1)
+    data = pd.DataFrame({'Close': close}, index=pd.date_range("2000-01-01", periods=n, freq="min"))
+    data['Position'] = pd.Series(signal, index=data.index).diff().fillna(0)
+    start = time.perf_counter()
+    portfolio = build_portfolio(data, 10000.0)
+    print(f"{n:,} bars in {time.perf_counter() - start:.3f}s, final value {portfolio['Total'].iloc[-1]:,.2f}")
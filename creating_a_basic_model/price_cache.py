@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Local columnar store for daily prices so the scripts do not re-download the full history on every run.
+# Every ticker gets a folder with memory-mappable .npy files:
+#   dates.npy   int64 nanoseconds since epoch
+#   values.npy  float64 (rows x columns), column names in meta.json
+#   meta.json   columns, timezone and the [start, end) date range already downloaded from yfinance
+# Saves write dates.npy and values.npy into a new version folder inside the ticker's folder and then swap in a
+# meta.json naming it with one os.replace (a folder cannot be renamed over a non empty one), so a reader that
+# loads the ticker while another process saves it gets the old or the new set, never a mix. A folder whose
+# meta.json names no version (e.g. a hand made fixture) holds the .npy files itself.
+# load_prices reads the store first and only downloads the dates outside the covered range, a range is only
+# marked covered once its download returned rows.
+# PRICE_CACHE_DIR points the store somewhere else (e.g. a fixture folder in CI) and PRICE_CACHE_OFFLINE=1
+# never touches the network, a ticker missing from the store then behaves like a failed download.
+
+CACHE_DIR = os.environ.get('PRICE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'price_cache'))
+OFFLINE = os.environ.get('PRICE_CACHE_OFFLINE', '0').lower() not in ('', '0', 'false', 'no')
+
+def _ticker_dir(ticker, cache_dir):
+    return os.path.join(cache_dir or CACHE_DIR, ticker.replace(os.sep, '_'))
+
+def _read_meta(folder):
+    meta_path = os.path.join(folder, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+def read_cached(ticker, cache_dir=None, attempts=3):
+    # returns (frame, meta) or (None, None) when the ticker is not in the store
+    folder = _ticker_dir(ticker, cache_dir)
+    for attempt in range(attempts):
+        meta = _read_meta(folder)
+        if meta is None:
+            return None, None
+        files = os.path.join(folder, meta['version']) if meta.get('version') else folder
+        try:
+            stamps = np.load(os.path.join(files, 'dates.npy'), mmap_mode='r')
+            values = np.load(os.path.join(files, 'values.npy'), mmap_mode='r')
+            break
+        except FileNotFoundError: # a save replaced this version after meta.json was read, read the new one
+            if attempt == attempts - 1:
+                raise
+    index = pd.DatetimeIndex(np.asarray(stamps).view('datetime64[ns]'), name='Date')
+    if meta.get('tz'):
+        index = index.tz_localize('UTC').tz_convert(meta['tz'])
+    return pd.DataFrame(np.asarray(values), index=index, columns=meta['columns']), meta
+
+def save_prices(ticker, data, start, end, cache_dir=None):
+    # writes the frame and the covered [start, end) range as a new version, swapped in by replacing meta.json
+    folder = _ticker_dir(ticker, cache_dir)
+    version = f"v{uuid.uuid4().hex}"
+    os.makedirs(os.path.join(folder, version))
+    data = data.sort_index()
+    index = data.index if isinstance(data.index, pd.DatetimeIndex) else pd.DatetimeIndex(data.index)
+    meta = {
+        'columns': [str(c) for c in data.columns],
+        'tz': str(index.tz) if index.tz is not None else None,
+        'start': str(pd.Timestamp(start).date()),
+        'end': str(pd.Timestamp(end).date()),
+        'version': version,
+    }
+    stamps = (index.tz_convert('UTC').tz_localize(None) if index.tz is not None else index).asi8
+    for name, array in (('dates.npy', stamps), ('values.npy', data.to_numpy(dtype=np.float64))):
+        with open(os.path.join(folder, version, name), 'wb') as f:
+            np.save(f, array)
+    previous = _read_meta(folder)
+    tmp = os.path.join(folder, f"meta.json.{version}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(folder, 'meta.json'))
+    if previous is not None and previous.get('version'):
+        # readers that already loaded the old version keep their memory maps, later ones read the new meta.json
+        shutil.rmtree(os.path.join(folder, previous['version']), ignore_errors=True)
+
+def download(ticker, start, end):
+    import yfinance as yf # only imported when something actually has to be fetched
+    data = yf.download(ticker, start=start, end=end, auto_adjust=True, progress=False) # auto adjust smoothes out things like stock splits
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = [col[0] for col in data.columns] # ('Close','TICKER') is flattened to just 'Close'
+    return data
+
+def load_prices(ticker, start, end, cache_dir=None, offline=None):
+    offline = OFFLINE if offline is None else offline
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize()
+    cached, meta = read_cached(ticker, cache_dir)
+
+    if not offline:
+        covered = None if cached is None else (pd.Timestamp(meta['start']), pd.Timestamp(meta['end']))
+        if covered is None:
+            missing = [(start, end)]
+        else:
+            missing = []
+            if start < covered[0]:
+                missing.append((start, covered[0]))
+            if end > covered[1]:
+                missing.append((covered[1], end))
+        pieces = []
+        for fetch_start, fetch_end in missing:
+            fetched = download(ticker, fetch_start.strftime("%Y-%m-%d"), fetch_end.strftime("%Y-%m-%d"))
+            if fetched.empty:
+                continue # failed or empty download, the range stays missing and is asked for again next time
+            pieces.append(fetched)
+            covered = (fetch_start, fetch_end) if covered is None else (min(covered[0], fetch_start), max(covered[1], fetch_end))
+        if pieces:
+            merged = pd.concat(pieces if cached is None else [cached] + pieces)
+            cached = merged[~merged.index.duplicated(keep='last')].sort_index()
+            save_prices(ticker, cached, covered[0], covered[1], cache_dir)
+
+    if cached is None:
+        return None
+    if cached.index.tz is not None:
+        start = start.tz_localize(cached.index.tz)
+        end = end.tz_localize(cached.index.tz)
+    return cached[(cached.index >= start) & (cached.index < end)]
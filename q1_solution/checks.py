@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+from execution import ExecutionSimulator, constant_latency
+from panel import run_panel
+from q1 import OUTPUT_COLUMNS, MeanReversionBacktester
+from streaming import replay
+
+# Equivalence checks between the different engines of the mean reversion strategy, run as a script:
+#
+#   python checks.py
+#
+# Every check builds its own seeded bars, runs two engines that have to agree and fails with an AssertionError
+# naming the first column that does not. Exact checks compare bits, engines that sum in a different order are
+# compared to a relative tolerance.
+#   replay      streaming.replay bar by bar            vs  MeanReversionBacktester.run()      (rtol 1e-9)
+#   panel       panel.run_panel on a ragged panel      vs  one backtester per symbol          (exact)
+#   lean        lean=True keeping every column         vs  the normal mode                    (exact)
+#   execution   ExecutionSimulator, no latency or cap  vs  _simulate_trades                   (rtol 1e-12)
+#               a submit latency of exactly one bar    vs  one a millisecond longer           (exact)
+#   resume      chained checkpoint() / resume()        vs  one run over all the bars          (exact, Turnover
+#                                                                                              to rtol 1e-12)
+
+def make_bars(n=390 * 10, seed=123):
+    # noisy sinusoidal minute closes with a drift, like the q1.py example, plus a volume column
+    rng = np.random.default_rng(seed)
+    minutes = pd.date_range("2025-01-01 09:30", periods=n, freq="min")
+    price = (
+        100 + np.linspace(0, 2, n) + 2 * np.sin(np.linspace(0, n / 78 * np.pi, n)) + rng.normal(0, 0.2, n)
+    )
+    return pd.DataFrame({'close': price, 'volume': rng.integers(100, 1000, n).astype(np.float64)}, index=minutes)
+
+def assert_same(actual, expected, columns, rtol=None):
+    assert actual.index.equals(expected.index), "different rows"
+    for column in columns:
+        if rtol is None:
+            np.testing.assert_array_equal(actual[column].to_numpy(), expected[column].to_numpy(), err_msg=column)
+        else:
+            np.testing.assert_allclose(actual[column], expected[column], rtol=rtol, atol=1e-6, err_msg=column)
+
+def check_replay(data):
+    batch = MeanReversionBacktester(data).run()
+    online = replay(data)
+    assert (online['signal'] == batch['signal']).all(), 'signal'
+    assert_same(online, batch, online.columns, rtol=1e-9)
+
+def check_panel(data, n_symbols=8, seed=5):
+    rng = np.random.default_rng(seed)
+    closes = pd.DataFrame(
+        data['close'].to_numpy()[:, None] + np.cumsum(rng.normal(0, 0.05, (len(data), n_symbols)), axis=0),
+        index=data.index, columns=[f"SYM{i}" for i in range(n_symbols)]
+    )
+    starts = rng.integers(0, len(data) // 3, n_symbols) # ragged: symbols start on different bars
+    closes[np.arange(len(data))[:, None] < starts] = np.nan
+    result = run_panel(closes)
+    for symbol in closes:
+        alone = MeanReversionBacktester(closes[[symbol]].dropna().rename(columns={symbol: 'close'})).run()
+        panel = pd.DataFrame({
+            column: result[column][symbol].loc[alone.index]
+            for column in ('portfolio', 'strategy_return', 'position', 'position_change')
+        })
+        assert_same(panel, alone, panel.columns)
+
+def check_lean(data):
+    normal = MeanReversionBacktester(data)
+    normal.run()
+    lean = MeanReversionBacktester(data, lean=True, columns=OUTPUT_COLUMNS)
+    lean.run()
+    assert_same(lean.data, normal.data, OUTPUT_COLUMNS)
+    expected = normal.evaluate_performance(plot=False, verbose=False)
+    for options in ({'columns': ('strategy_return',)}, {'dtype': np.float32}): # run() computes these metrics
+        small = MeanReversionBacktester(data, lean=True, **options)
+        small.run()
+        assert small.evaluate_performance(plot=False, verbose=False) == expected, f"metrics with {options}"
+
+def check_execution(data):
+    columns = ('position', 'position_change', 'transaction_cost', 'cash', 'portfolio', 'strategy_return')
+    for latency in (1, 2):
+        batch = MeanReversionBacktester(data, latency=latency).run()
+        simulated = MeanReversionBacktester(
+            data, latency=latency, execution=ExecutionSimulator(constant_latency(0.0), participation=np.inf)
+        ).run()
+        assert_same(simulated, batch, columns, rtol=1e-12)
+    # an order acked exactly at a later bar's close works from the next bar on, like any later ack: with an
+    # unlimited participation both fill in full one bar after that close, while one acked before it fills there
+    runs = {
+        seconds: MeanReversionBacktester(
+            data, execution=ExecutionSimulator(constant_latency(seconds), participation=np.inf)
+        ).run()
+        for seconds in (59.999, 60.0, 60.001) # one minute bars
+    }
+    assert_same(runs[60.0], runs[60.001], columns)
+    assert not np.array_equal(runs[60.0]['position'], runs[59.999]['position']), 'acked at a close filled there'
+
+def check_resume(data, cuts=(0.4, 0.41, 0.7)):
+    full = MeanReversionBacktester(data)
+    full.run()
+    bounds = [int(len(data) * cut) for cut in cuts] + [len(data)]
+    resumed = MeanReversionBacktester(data.iloc[:bounds[0]])
+    parts = [resumed.run()]
+    for start, end in zip(bounds, bounds[1:]):
+        resumed = MeanReversionBacktester.resume(resumed.checkpoint(), data.iloc[start:end])
+        parts.append(resumed.run())
+    assert_same(pd.concat(parts), full.data, full.data.columns)
+    metrics = resumed.evaluate_performance(plot=False, verbose=False)
+    expected = full.evaluate_performance(plot=False, verbose=False)
+    np.testing.assert_allclose(metrics.pop('Turnover'), expected.pop('Turnover'), rtol=1e-12, err_msg='Turnover')
+    assert metrics == expected, 'metrics'
+
+CHECKS = {
+    'replay': check_replay, 'panel': check_panel, 'lean': check_lean, 'execution': check_execution,
+    'resume': check_resume,
+}
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    data = make_bars()
+    for name in sys.argv[1:] or CHECKS:
+        start = time.perf_counter()
+        CHECKS[name](data)
+        print(f"{name:10s} ok  {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,243 @@
+import heapq
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Event-driven execution for MeanReversionBacktester(execution=ExecutionSimulator(...)), replacing
+# _simulate_trades' "the whole position change fills at close +- slippage" with a latency queue and partial fills.
+#
+# Time is measured in bars: bar j covers [j, j + 1) and its close is known at j + 1. Events live in one heap of
+# (time, priority, seq, kind, order) tuples:
+#   DECISION   end of a bar where the target position changed: working orders get a CANCEL and a new order
+#              for target - position is submitted (SUBMIT is logged at the same time)
+#   ACK        the order reached the market submit_latency later and starts working. One sent without submit
+#              latency arrives at the close it was decided on and fills there right away, up to what is left of
+#              the bar's participation cap. Any later arrival, a bar boundary included, works from the next bar on
+#   FILL       end of a bar the order was working in: it fills up to participation * bar volume * the share of
+#              the bar it was live for, at close +- slippage; what is left is rescheduled for the next bar
+#   CANCEL     the cancel arrived cancel_latency after it was sent: the order fills for the part of the bar
+#              before it and the rest is dropped
+# Orders in the same bar share the bar's volume cap, first acked first filled. Latencies are in seconds and
+# drawn from the latency samplers below. The decision of bar i goes out at its close, so use latency=0 on the
+# backtester: the simulator's latency replaces the signal shift. With zero submit latency and an unlimited
+# participation (np.inf) every decision fills in full at the close of its own bar, which is _simulate_trades
+# with the same signal shift (checked in __main__). The one difference is a position already held on the first
+# bar (latency=0 and an entry there): _simulate_trades takes it without trading, the simulator buys it.
+# Orders are __slots__ records, the heap holds plain tuples and the event log (record_events=True) is kept in
+# compact array.array columns, so runs with tens of millions of events stay in memory.
+
+FILL, CANCEL, DECISION, ACK, SUBMIT = 0, 1, 2, 3, 4 # heap priority at equal times: a bar's fills come before the next decision
+EVENT_NAMES = {FILL: 'fill', CANCEL: 'cancel', DECISION: 'decision', ACK: 'ack', SUBMIT: 'submit'}
+LATENCY_BLOCK = 4096
+
+def constant_latency(seconds):
+    return lambda rng, size: np.full(size, float(seconds))
+
+def exponential_latency(mean, minimum=0.0):
+    return lambda rng, size: minimum + rng.exponential(mean, size)
+
+def lognormal_latency(median, sigma):
+    return lambda rng, size: rng.lognormal(np.log(median), sigma, size)
+
+def empirical_latency(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return lambda rng, size: rng.choice(samples, size)
+
+class _LatencyStream:
+    __slots__ = ('sampler', 'rng', 'scale', 'values', 'position')
+
+    def __init__(self, sampler, rng, bar_seconds):
+        self.sampler = sampler
+        self.rng = rng
+        self.scale = 1 / bar_seconds
+        self.values = []
+        self.position = 0
+
+    def next(self):
+        # one latency in bars, drawn LATENCY_BLOCK at a time
+        if self.position == len(self.values):
+            self.values = (np.asarray(self.sampler(self.rng, LATENCY_BLOCK)) * self.scale).tolist()
+            self.position = 0
+        value = self.values[self.position]
+        self.position += 1
+        return value
+
+class Order:
+    __slots__ = ('id', 'side', 'remaining', 'sent_at', 'live_from', 'cancelled')
+
+    def __init__(self, order_id, quantity, sent_at):
+        self.id = order_id
+        self.side = 1.0 if quantity > 0 else -1.0
+        self.remaining = abs(quantity)
+        self.sent_at = sent_at # decision time
+        self.live_from = None # ack time, None while in flight
+        self.cancelled = False
+
+class ExecutionSimulator:
+    def __init__(self, submit_latency=constant_latency(0.05), cancel_latency=None, participation=0.1,
+                 seed=0, record_events=False, min_quantity=1e-9):
+        self.submit_latency = submit_latency
+        self.cancel_latency = cancel_latency or submit_latency
+        self.participation = participation
+        self.seed = seed
+        self.record_events = record_events
+        self.min_quantity = min_quantity # smaller target changes are not sent
+        self.stats = {}
+        self.events = None
+
+    def simulate(self, close, volume, target, slippage, fee, index=None):
+        # returns per bar arrays: filled quantity, signed traded notional and transaction cost.
+        # index (DatetimeIndex of the bars) sets the bar length the latencies are measured against
+        bar_seconds = bar_seconds_of(index)
+        close = np.asarray(close, dtype=np.float64).tolist()
+        volume = np.asarray(volume, dtype=np.float64).tolist()
+        target = np.asarray(target, dtype=np.float64)
+        n = len(close)
+        rng = np.random.default_rng(self.seed)
+        submit_latency = _LatencyStream(self.submit_latency, rng, bar_seconds)
+        cancel_latency = _LatencyStream(self.cancel_latency, rng, bar_seconds)
+        participation = self.participation
+        min_quantity = self.min_quantity
+        filled = [0.0] * n
+        notional = [0.0] * n
+        traded = [0.0] * n # unsigned notional, for the fees
+
+        changes = np.flatnonzero(np.abs(np.diff(target, prepend=0.0)) > min_quantity).tolist()
+        targets = target.tolist()
+        log = (array('d'), array('b'), array('q'), array('d'), array('d')) if self.record_events else None
+        counts = dict.fromkeys(('submit', 'ack', 'fill', 'cancel'), 0)
+        working = [] # orders acked or in flight that are not cancelled
+        heap = []
+        seq = 0
+        position = 0.0
+        cap_bar = -1
+        cap_left = 0.0
+        next_change = 0
+        order_count = 0
+        if changes:
+            heapq.heappush(heap, (changes[0] + 1.0, DECISION, seq, DECISION, None))
+
+        def fill(order, bar, share, end):
+            # fills order for the share of bar it was live for (at the bar's close `end`), returns the quantity
+            nonlocal cap_bar, cap_left, position
+            if bar >= n:
+                return 0.0
+            if bar != cap_bar:
+                cap_bar = bar
+                cap_left = participation * volume[bar]
+            quantity = min(order.remaining, cap_left, participation * volume[bar] * share)
+            if quantity <= 0:
+                return 0.0
+            cap_left -= quantity
+            order.remaining -= quantity
+            price = close[bar] * (1 + slippage * order.side)
+            signed = order.side * quantity
+            position += signed
+            filled[bar] += signed
+            notional[bar] += signed * price
+            traded[bar] += quantity * price
+            if log is not None:
+                for column, value in zip(log, (end, FILL, order.id, signed, price)):
+                    column.append(value)
+            counts['fill'] += 1
+            return quantity
+
+        while heap:
+            time, _, _, kind, order = heapq.heappop(heap)
+            if kind == DECISION:
+                bar = next_change
+                next_change += 1
+                if next_change < len(changes):
+                    seq += 1
+                    heapq.heappush(heap, (changes[next_change] + 1.0, DECISION, seq, DECISION, None))
+                for old in working:
+                    if old.remaining <= 0: # already filled or cancelled
+                        continue
+                    old.cancelled = True
+                    seq += 1
+                    heapq.heappush(heap, (time + cancel_latency.next(), CANCEL, seq, CANCEL, old))
+                working = []
+                quantity = targets[changes[bar]] - position
+                if abs(quantity) <= min_quantity:
+                    continue
+                order = Order(order_count, quantity, time)
+                order_count += 1
+                working.append(order)
+                counts['submit'] += 1
+                if log is not None:
+                    for column, value in zip(log, (time, SUBMIT, order.id, quantity, np.nan)):
+                        column.append(value)
+                seq += 1
+                heapq.heappush(heap, (time + submit_latency.next(), ACK, seq, ACK, order))
+            elif kind == ACK:
+                counts['ack'] += 1
+                if log is not None:
+                    for column, value in zip(log, (time, ACK, order.id, order.remaining * order.side, np.nan)):
+                        column.append(value)
+                order.live_from = time
+                if time == order.sent_at and time <= n: # no submit latency, fills at the decision's close
+                    fill(order, int(time) - 1, 1.0, time)
+                if order.remaining > 0 and time < n:
+                    seq += 1
+                    heapq.heappush(heap, (float(int(time)) + 1.0, FILL, seq, FILL, order))
+            elif kind == FILL:
+                if order.remaining <= 0: # filled or cancelled since it was scheduled
+                    continue
+                bar = int(time) - 1
+                fill(order, bar, time - max(order.live_from, bar), time)
+                if order.remaining > 0 and time < n:
+                    seq += 1
+                    heapq.heappush(heap, (time + 1.0, FILL, seq, FILL, order))
+            else: # CANCEL
+                counts['cancel'] += 1
+                if log is not None:
+                    for column, value in zip(log, (time, CANCEL, order.id, order.remaining * order.side, np.nan)):
+                        column.append(value)
+                if order.live_from is not None and order.live_from < time and order.remaining > 0:
+                    bar = int(time)
+                    fill(order, bar, time - max(order.live_from, bar), time)
+                order.remaining = 0.0
+
+        self.stats = dict(counts, orders=order_count, events=sum(counts.values()))
+        if log is not None:
+            self.events = pd.DataFrame({
+                'time': np.frombuffer(log[0], dtype=np.float64), 'event': pd.Categorical.from_codes(
+                    np.frombuffer(log[1], dtype=np.int8), categories=[EVENT_NAMES[code] for code in range(5)]
+                ),
+                'order': np.frombuffer(log[2], dtype=np.int64), 'quantity': np.frombuffer(log[3], dtype=np.float64),
+                'price': np.frombuffer(log[4], dtype=np.float64),
+            })
+        filled = np.array(filled)
+        notional = np.array(notional)
+        return filled, notional, np.array(traded) * fee
+
+def bar_seconds_of(index):
+    # typical bar length of a DatetimeIndex in seconds
+    if isinstance(index, pd.DatetimeIndex) and len(index) > 1:
+        return float(np.median(np.diff(index.asi8))) / 1e9
+    return 60.0
+
+if __name__ == "__main__":
+    import time
+    from q1 import MeanReversionBacktester
+
+    rng = np.random.default_rng(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=390 * 20, freq="min")
+    price = 100 + 2 * np.sin(np.linspace(0, 100 * np.pi, len(minutes))) + rng.normal(0, 0.2, len(minutes))
+    data = pd.DataFrame({'close': price, 'volume': rng.integers(100, 1000, len(minutes))}, index=minutes)
+
+    # without submit latency or a volume cap the simulator has to reproduce _simulate_trades
+    for latency in (1, 2):
+        batch = MeanReversionBacktester(data, latency=latency).run()
+        simulated = MeanReversionBacktester(
+            data, latency=latency, execution=ExecutionSimulator(constant_latency(0.0), participation=np.inf)
+        ).run()
+        for column in ('position', 'position_change', 'transaction_cost', 'cash', 'portfolio', 'strategy_return'):
+            np.testing.assert_allclose(simulated[column], batch[column], rtol=1e-12, atol=1e-9, err_msg=column)
+
+    simulator = ExecutionSimulator(exponential_latency(0.5), participation=0.1)
+    start = time.perf_counter()
+    MeanReversionBacktester(data, latency=0, execution=simulator).run()
+    elapsed = time.perf_counter() - start
+    print(f"matches _simulate_trades without latency, {simulator.stats['events']:,} events in {elapsed:.2f}s")
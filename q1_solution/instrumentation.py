@@ -0,0 +1,154 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Opt-in per-stage instrumentation.
+# Pipelines take an `instrument=None` argument and wrap their stages in instrument.stage(name, frame).
+# frame can also be a function returning it, called when the stage starts and when it ends, for stages that
+# replace their frame instead of adding to it (e.g. q1's lean mode).
+# With None they use a shared contextlib.nullcontext, so the disabled cost is one branch per stage.
+# Callers only rely on the stage() method, which is why q3.py and portfolio_engine.py need no import from here.
+#
+# Every stage produces one record:
+#   stage            stage name, e.g. 'q1._simulate_trades'
+#   seconds          wall time
+#   rows             len(frame) when the stage ends
+#   columns_added    columns the stage added to frame
+#   frame_bytes      growth of frame.memory_usage() over the stage, negative when it shrank
+#   allocated_bytes  traced bytes still alive after the stage, negative when it freed more (trace_memory=True only)
+#   peak_bytes       traced peak above the stage's starting point (trace_memory=True only)
+# plus the instrument's labels. Records go to every sink: MemorySink, JsonLinesSink, PrometheusSink.
+
+class MemorySink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def report(self):
+        # one row per stage with call counts and totals
+        if not self.records:
+            return pd.DataFrame()
+        frame = pd.DataFrame(self.records)
+        numeric = [name for name in ('seconds', 'rows', 'frame_bytes', 'allocated_bytes', 'peak_bytes') if name in frame]
+        report = frame.groupby('stage', sort=False)[numeric].sum(min_count=1)
+        report.insert(0, 'calls', frame.groupby('stage', sort=False).size())
+        if 'peak_bytes' in frame:
+            report['peak_bytes'] = frame.groupby('stage', sort=False)['peak_bytes'].max()
+        return report
+
+class JsonLinesSink:
+    def __init__(self, path_or_file):
+        self.file = open(path_or_file, 'a') if isinstance(path_or_file, str) else path_or_file
+        self.owned = isinstance(path_or_file, str)
+
+    def emit(self, record):
+        self.file.write(json.dumps(record, default=str) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+class PrometheusSink:
+    # accumulates counters per (stage, labels) and renders them in the Prometheus text exposition format.
+    # The byte deltas are signed (a stage can free memory), so they are gauges holding the last run's value
+    METRICS = (
+        ('calls', 'stage_calls_total', 'counter', 'Number of times the stage ran'),
+        ('seconds', 'stage_seconds_total', 'counter', 'Wall time spent in the stage'),
+        ('rows', 'stage_rows_total', 'counter', 'Rows processed by the stage'),
+        ('frame_bytes', 'stage_frame_bytes', 'gauge', 'Bytes the last run of the stage added to its frame'),
+        ('allocated_bytes', 'stage_allocated_bytes', 'gauge', 'Traced bytes the last run of the stage left allocated'),
+    )
+
+    def __init__(self, namespace='backtest'):
+        self.namespace = namespace
+        self.totals = {}
+
+    def emit(self, record):
+        labels = tuple(sorted(
+            (key, str(value)) for key, value in record.items()
+            if key not in ('seconds', 'rows', 'columns_added', 'frame_bytes', 'allocated_bytes', 'peak_bytes', 'time')
+        ))
+        totals = self.totals.setdefault(labels, dict.fromkeys((name for name, _, _, _ in self.METRICS), 0))
+        totals['calls'] += 1
+        for name, _, kind, _ in self.METRICS[1:]:
+            if record.get(name) is not None:
+                totals[name] = totals[name] + record[name] if kind == 'counter' else record[name]
+
+    def render(self):
+        lines = []
+        for name, metric, kind, help_text in self.METRICS:
+            metric = f"{self.namespace}_{metric}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for labels, totals in self.totals.items():
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                lines.append(f"{metric}{{{label_text}}} {totals[name]:.17g}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            f.write(self.render())
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _frame_state(frame):
+    if frame is None:
+        return None, None
+    frame = frame() if callable(frame) else frame
+    return set(frame.columns), int(frame.memory_usage(index=False).sum())
+
+class Instrument:
+    def __init__(self, *sinks, trace_memory=False, **labels):
+        self.sinks = list(sinks) or [MemorySink()]
+        self.trace_memory = trace_memory
+        self.labels = labels
+        self._peaks = [] # traced peak of every open stage, so nested stages keep their parents' peaks
+
+    @property
+    def report(self):
+        # report of the first MemorySink
+        for sink in self.sinks:
+            if isinstance(sink, MemorySink):
+                return sink.report()
+        raise ValueError("no MemorySink attached")
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        columns, frame_bytes = _frame_state(frame)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(current)
+            traced_start = current
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            record = {'stage': name, 'time': time.time(), 'seconds': seconds, **self.labels}
+            if frame is not None:
+                ended = frame() if callable(frame) else frame
+                new_columns, new_bytes = _frame_state(ended)
+                record['rows'] = len(ended)
+                record['columns_added'] = sorted(map(str, new_columns - columns))
+                record['frame_bytes'] = new_bytes - frame_bytes
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, self._peaks.pop())
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                record['allocated_bytes'] = current - traced_start
+                record['peak_bytes'] = peak - traced_start
+            for sink in self.sinks:
+                sink.emit(record)
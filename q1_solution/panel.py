@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from q1 import performance_metrics, window_mean_std
+
+# Panel mode of the mean reversion strategy: one (time x symbol) array of closes, every step of
+# MeanReversionBacktester done column-wise in a single pass instead of one frame and one object per symbol.
+# Symbols may start (and stop) on different dates, their missing closes are NaN and every step is masked so
+# each column gives the same numbers as a separate MeanReversionBacktester run over that symbol's own history.
+# Histories are expected to be contiguous between a symbol's first and last close.
+
+def _shift(values, periods, fill):
+    shifted = np.full_like(values, fill)
+    if periods == 0:
+        shifted[:] = values
+    elif periods < len(values):
+        shifted[periods:] = values[:-periods]
+    return shifted
+
+def run_panel(
+    closes, index=None, symbols=None, lookback=20, entry_z=-1.0, exit_z=0.0, slippage=0.0005, fee=0.0003,
+    latency=1, volatility_lookback=60, capital=1e6, max_vol=0.02
+):
+    # closes: DataFrame or 2-D array (time x symbol), capital is allocated to every symbol
+    if not isinstance(closes, pd.DataFrame):
+        closes = pd.DataFrame(np.asarray(closes, dtype=np.float64), index=index, columns=symbols)
+    close = closes.to_numpy(dtype=np.float64)
+
+    returns = closes.pct_change(fill_method=None)
+    # each symbol's rolling windows are aligned on its own first close, as in a run over its history alone
+    start = -np.argmax(~np.isnan(close), axis=0)
+    mean, std = window_mean_std(close, lookback, start)
+    volatility = window_mean_std(returns, volatility_lookback, start)[1] * np.sqrt(252 * 390)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zscore = (close - mean) / std
+        valid = ~(np.isnan(zscore) | np.isnan(volatility)) # the rows the per-symbol dropna keeps
+        first = valid & ~_shift(valid, 1, False)
+
+        raw = ((zscore < entry_z) & ~(zscore > exit_z) & valid).astype(np.float64)
+        signal = np.where(valid, _shift(raw, latency, 0.0), 0.0)
+
+        scaled = np.minimum(capital * max_vol / volatility, capital) / close
+        scaled = np.where(np.isnan(scaled), 0.0, scaled)
+        position = np.where(valid, signal * scaled, 0.0)
+
+        position_change = np.diff(position, axis=0, prepend=0.0)
+        position_change[first | ~valid] = 0.0
+        trade_price = np.where(valid, close * (1 + slippage * np.sign(position_change)), 0.0)
+        transaction_cost = trade_price * np.abs(position_change) * fee
+        cash = capital - (np.cumsum(trade_price * position_change, axis=0) + np.cumsum(transaction_cost, axis=0))
+        holdings = position * close
+        portfolio = np.where(valid, cash + holdings, np.nan)
+        strategy_return = np.where(first, 0.0, portfolio / _shift(portfolio, 1, np.nan) - 1)
+
+    frame = lambda values: pd.DataFrame(values, index=closes.index, columns=closes.columns)
+    portfolio = frame(portfolio)
+    strategy_return = frame(strategy_return)
+    position = frame(np.where(valid, position, np.nan))
+    position_change = frame(np.where(valid, position_change, np.nan))
+
+    # symbols that have not started yet hold their capital in cash, finished ones keep their last value
+    aggregate_portfolio = portfolio.ffill().fillna(capital).sum(axis=1)
+    aggregate_return = aggregate_portfolio.pct_change().fillna(0)
+    gross_exposure = (position * closes).abs().sum(axis=1)
+    traded_notional = (position_change * frame(trade_price)).abs().sum(axis=1)
+
+    return {
+        'portfolio': portfolio,
+        'strategy_return': strategy_return,
+        'position': position,
+        'position_change': position_change,
+        'symbol_metrics': panel_metrics(strategy_return, position, position_change),
+        'aggregate_portfolio': aggregate_portfolio,
+        # turnover of the aggregate is measured on notional since share counts do not add up across symbols
+        'aggregate_metrics': performance_metrics(aggregate_return, gross_exposure, traded_notional),
+    }
+
+def panel_metrics(strategy_return, position, position_change):
+    # performance_metrics for every column at once, NaN marks bars outside a symbol's history
+    returns = strategy_return.to_numpy()
+    valid = ~np.isnan(returns)
+    has_data = valid.any(axis=0)
+    cum_returns = np.nancumprod(1 + returns, axis=0)
+    roll_max = np.maximum.accumulate(cum_returns, axis=0)
+    drawdown = np.where(valid, (cum_returns - roll_max) / roll_max, np.nan)
+
+    # daily sums between each symbol's first and last day, empty days inside that range count as 0
+    daily = strategy_return.resample('1D').sum()
+    day_index = daily.index.to_numpy()
+    stamps = strategy_return.index.to_numpy()
+    first_row = valid.argmax(axis=0)
+    last_row = len(returns) - 1 - valid[::-1].argmax(axis=0)
+    first_day = stamps[first_row].astype('datetime64[D]')
+    last_day = stamps[last_row].astype('datetime64[D]')
+    in_range = (day_index[:, None] >= first_day) & (day_index[:, None] <= last_day)
+    daily_values = np.where(in_range, daily.to_numpy(), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_std = pd.DataFrame(daily_values).std().to_numpy()
+        daily_mean = pd.DataFrame(daily_values).mean().to_numpy()
+        sharpe = np.where(daily_std > 0, np.sqrt(252) * daily_mean / daily_std, np.nan)
+
+        days = (stamps[last_row] - stamps[first_row]).astype('timedelta64[D]').astype(np.int64)
+        cagr = np.where(days > 0, cum_returns[last_row, np.arange(returns.shape[1])] ** (365 / np.maximum(days, 1)) - 1, np.nan)
+        avg_gross_position = position.abs().mean().to_numpy()
+        total_traded = position_change.abs().sum().to_numpy()
+        turnover = np.where(avg_gross_position > 0, total_traded / avg_gross_position, np.nan)
+        wins = (returns > 0).sum(axis=0)
+        active = (valid & (returns != 0)).sum(axis=0)
+        hit_rate = np.where(active > 0, wins / active, np.nan)
+
+    metrics = pd.DataFrame({
+        'Sharpe': sharpe,
+        'Max Drawdown': np.where(valid, drawdown, np.inf).min(axis=0),
+        'CAGR': cagr,
+        'Turnover': turnover,
+        'Hit Rate': hit_rate,
+    }, index=strategy_return.columns)
+    metrics.loc[~has_data] = np.nan
+    return metrics
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=390 * 10, freq="min")
+    n_symbols = 300
+    phases = rng.uniform(0, 2 * np.pi, n_symbols)
+    t = np.linspace(0, 40 * np.pi, len(minutes))[:, None]
+    closes = 100 + 2 * np.sin(t + phases) + rng.normal(0, 0.2, (len(minutes), n_symbols))
+    starts = rng.integers(0, len(minutes) // 2, n_symbols) # ragged histories
+    closes[np.arange(len(minutes))[:, None] < starts] = np.nan
+    closes = pd.DataFrame(closes, index=minutes, columns=[f"SYM{i}" for i in range(n_symbols)])
+
+    start = time.perf_counter()
+    result = run_panel(closes)
+    print(f"{n_symbols} symbols x {len(minutes)} bars in {time.perf_counter() - start:.2f}s")
+    print(result['symbol_metrics'].describe().to_string())
+    print(result['aggregate_metrics'])
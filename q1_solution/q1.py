@@ -1,13 +1,245 @@
+from contextlib import nullcontext
+
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+NO_STAGE = nullcontext() # stage context when no instrument is passed, see instrumentation.py
+
+# lean=True keeps these columns unless told otherwise, they are all evaluate_performance needs
+LEAN_COLUMNS = ('close', 'position', 'position_change', 'strategy_return')
+# every column the normal mode adds to the input
+OUTPUT_COLUMNS = (
+    'returns', 'mean', 'std', 'zscore', 'volatility', 'signal', 'vol_scaled_position', 'position',
+    'position_change', 'trade_price', 'transaction_cost', 'holdings', 'cash', 'portfolio', 'strategy_return'
+)
+# running sums over the whole history, kept in float64 whatever dtype is asked for
+ACCOUNTING_COLUMNS = ('holdings', 'cash', 'portfolio')
+# constructor arguments a checkpoint records, resume() runs with the same ones
+CHECKPOINT_PARAMS = (
+    'lookback', 'entry_z', 'exit_z', 'slippage', 'fee', 'latency', 'volatility_lookback', 'capital', 'max_vol'
+)
+WINDOW_BLOCK = 1 << 14 # values per block of window_mean_std, small enough for its buffers to stay in cache
+
+def window_mean_std(values, window, start=0):
+    # rolling mean and sample std (ddof=1) of `window` rows of a 1-D or (rows x columns) array, NaN for the first
+    # window - 1 rows and for windows holding a NaN, like pandas rolling(window).mean() / .std().
+    # pandas carries running sums from the first row, so its result depends on where the series starts. Here the
+    # sums restart at every segment of `window` rows, counted from the bar numbered 0: values[0] is bar `start`
+    # (one number, or one per column), a window spans at most two segments and its sums only depend on their
+    # values, so a run resumed from a tail of raw bars gets the same bits as a full run, in O(rows).
+    # Every window is shifted by the first value of the segment it ends in (a value inside the window) before
+    # squaring, so the variance does not cancel
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.reshape(len(values), -1)
+    mean = np.full(flat.shape, np.nan)
+    std = np.full(flat.shape, np.nan)
+    lead = np.broadcast_to(np.asarray(start) % window, flat.shape[1:]) # bars of the first segment before values[0]
+    for offset in np.unique(lead):
+        columns = np.flatnonzero(lead == offset)
+        if len(columns) == flat.shape[1]:
+            _segment_mean_std(flat, window, offset, mean, std)
+        else: # ragged panel columns
+            group_mean, group_std = np.full((len(flat), len(columns)), np.nan), np.full((len(flat), len(columns)), np.nan)
+            _segment_mean_std(flat[:, columns], window, offset, group_mean, group_std)
+            mean[:, columns] = group_mean
+            std[:, columns] = group_std
+    return mean.reshape(values.shape), std.reshape(values.shape)
+
+def _segment_mean_std(values, window, lead, mean, std):
+    # window_mean_std of (rows x columns) values whose first row is bar `lead` of its segment, written to mean/std
+    rows, width = values.shape
+    segments = -(-(rows + lead) // window)
+    block = max(WINDOW_BLOCK // (window * width), 1) # segments per block
+    for first in range(0, segments, block):
+        last = min(first + block, segments)
+        low, high = (first - 1) * window - lead, last * window - lead # rows of segments first - 1 .. last - 1
+        chunk = np.full(((last - first + 1) * window, width), np.nan)
+        chunk[max(-low, 0):min(high, rows) - low] = values[max(low, 0):min(high, rows)]
+        chunk = chunk.reshape(last - first + 1, window, width)
+        reference = chunk[1:, :1] # first value of the segments the windows end in
+        ending = chunk[1:] - reference # the part of a window in its own segment, from its first value
+        spilled = chunk[:-1] - reference # the part in the previous segment, shifted by the same reference
+        total = np.zeros_like(ending)
+        square = np.zeros_like(ending)
+        # sums from the row after each position to the end of the previous segment, reversed cumulative sums
+        np.cumsum(spilled[:, :0:-1], axis=1, out=total[:, -2::-1])
+        spilled *= spilled
+        np.cumsum(spilled[:, :0:-1], axis=1, out=square[:, -2::-1])
+        total += np.cumsum(ending, axis=1)
+        ending *= ending
+        square += np.cumsum(ending, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = (square - total * total / window) / (window - 1)
+        total /= window
+        total += reference
+        np.maximum(variance, 0.0, out=variance)
+        np.sqrt(variance, out=variance)
+        keep = slice(max(lead - first * window, 0), None) # rows before values[0] are padding
+        out = slice(max(first * window - lead, 0), min(high, rows))
+        mean[out] = total.reshape(-1, width)[keep][:out.stop - out.start]
+        std[out] = variance.reshape(-1, width)[keep][:out.stop - out.start]
+
+def add_rolling_features(df, lookback, volatility_lookback, cache=None, start=0):
+    # cache is an optional dict shared between calls on the same close series, so that
+    # runs that share a window (e.g. a parameter sweep) only compute each rolling statistic once.
+    # start is the bar number of df's first row, which window_mean_std aligns its segments on
+    def rolling(key, compute):
+        if cache is None:
+            return compute()
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    df['returns'] = rolling(('returns',), lambda: df['close'].pct_change())
+    df['mean'], df['std'] = rolling(('mean_std', lookback, start), lambda: window_mean_std(df['close'], lookback, start))
+    df['zscore'] = (df['close'] - df['mean']) / df['std']
+    df['volatility'] = rolling(
+        ('volatility', volatility_lookback, start),
+        lambda: window_mean_std(df['returns'], volatility_lookback, start)[1] * np.sqrt(252 * 390)
+    )
+    df.dropna(inplace=True)
+    return df
+
+def equity_curve(strategy_return):
+    cum_returns = (1 + strategy_return).cumprod()
+    roll_max = cum_returns.cummax()
+    drawdown = (cum_returns - roll_max) / roll_max
+    return cum_returns, drawdown
+
+def performance_metrics(strategy_return, position, position_change, carried=None):
+    # metrics reported by evaluate_performance, usable on any strategy_return series with a DatetimeIndex.
+    # carried is the performance_state of the rows before these ones (a resumed run), the metrics then cover both
+    return _performance(strategy_return, position, position_change, carried)[0]
+
+def performance_state(strategy_return, position, position_change, carried=None):
+    # what performance_metrics needs to continue after these rows: the equity curve's last value, peak and
+    # deepest drawdown, the daily return sums of the finished days and the rows of the last day (later rows may
+    # still fall on it), the first bar's time and the totals behind turnover and hit rate. It holds one value
+    # per day and one day of rows, not the history
+    if not len(strategy_return):
+        return carried
+    return _performance(strategy_return, position, position_change, carried)[1]
+
+def _performance(strategy_return, position, position_change, carried):
+    # (metrics, state). Continuing from carried gives the same metrics as one call over all the rows, except
+    # turnover which is summed in two parts and can differ in the last bits
+    # the equity curve is worked out in two arrays reused in place, lean mode runs this next to its kept columns
+    if carried is None:
+        cum_returns = np.add(strategy_return.to_numpy(), 1)
+        np.cumprod(cum_returns, out=cum_returns)
+        roll_max = np.maximum.accumulate(cum_returns)
+        rows = strategy_return
+    else:
+        cum_returns = np.concatenate([[carried['cumulative']], strategy_return.to_numpy()])
+        cum_returns[1:] += 1
+        np.cumprod(cum_returns, out=cum_returns)
+        cum_returns[0] = carried['peak']
+        roll_max = np.maximum.accumulate(cum_returns)[1:]
+        cum_returns = cum_returns[1:]
+        rows = pd.concat([carried['day'], strategy_return])
+    cumulative, peak = cum_returns[-1], roll_max[-1]
+    drawdown = np.subtract(cum_returns, roll_max, out=cum_returns)
+    drawdown /= roll_max
+    max_drawdown = drawdown.min() if carried is None else min(drawdown.min(), carried['max_drawdown'])
+    del drawdown, roll_max
+    daily_returns = rows.resample('1D').sum()
+    if carried is not None:
+        daily_returns = pd.concat([carried['daily'], daily_returns])
+    last_day = rows.index[-1].normalize()
+    previous = carried or {'gross': 0.0, 'rows': 0, 'traded': 0.0, 'wins': 0, 'active': 0}
+    state = {
+        'first': strategy_return.index[0] if carried is None else carried['first'],
+        'last': strategy_return.index[-1],
+        'cumulative': cumulative,
+        'peak': peak,
+        'max_drawdown': max_drawdown,
+        'daily': daily_returns.iloc[:-1],
+        'day': rows[rows.index >= last_day],
+        'gross': previous['gross'] + position.abs().sum(),
+        'rows': previous['rows'] + len(position),
+        'traded': previous['traded'] + position_change.abs().sum(),
+        'wins': previous['wins'] + (strategy_return > 0).sum(),
+        'active': previous['active'] + (strategy_return != 0).sum(),
+    }
+    sharpe = np.sqrt(252) * daily_returns.mean() / daily_returns.std() if daily_returns.std() > 0 else np.nan
+    days = (state['last'] - state['first']).days
+    cagr = state['cumulative'] ** (365 / days) - 1 if days > 0 else np.nan
+    avg_gross_position = state['gross'] / state['rows'] # position.abs().mean() on a single call
+    total_traded = state['traded']
+    turnover = total_traded / avg_gross_position if avg_gross_position > 0 else np.nan
+    hit_rate = state['wins'] / state['active'] if state['active'] > 0 else np.nan
+    return {
+        "Sharpe": sharpe,
+        "Max Drawdown": max_drawdown,
+        "CAGR": cagr,
+        "Turnover": turnover,
+        "Hit Rate": hit_rate
+    }, state
+
+def _cumsum(values, start=None):
+    # values.cumsum(), continuing from the running total `start` of the rows before them
+    if start is None:
+        return values.cumsum()
+    summed = np.cumsum(np.concatenate([[start], values.to_numpy(dtype=np.float64)]))[1:]
+    return pd.Series(summed, index=values.index)
+
+def save_checkpoint(state, path):
+    pd.to_pickle(state, path)
+
+def load_checkpoint(path):
+    return pd.read_pickle(path)
 
 class MeanReversionBacktester:
     def __init__(
         self, data, lookback=20, entry_z=-1.0, exit_z=0.0, slippage=0.0005, fee=0.0003,
-        latency=1, volatility_lookback=60, capital=1e6, max_vol=0.02
+        latency=1, volatility_lookback=60, capital=1e6, max_vol=0.02, prepared=False, instrument=None,
+        lean=False, columns=LEAN_COLUMNS, dtype=np.float64, execution=None, resume_from=None, regime_gate=None
     ):
-        self.data = data.copy()
+        # prepared=True means data already went through add_rolling_features for these windows,
+        # the derived columns are reused and only new columns are added to a shallow copy.
+        # instrument (instrumentation.Instrument) records time/memory/rows of every stage when given.
+        #
+        # lean=True is the low-memory mode: the input is not copied, run() computes everything on numpy
+        # arrays that are reused in place and self.data ends up with only `columns` (any of the usual
+        # output columns or input columns). Kept columns are stored as `dtype` (float32 halves them), except
+        # holdings/cash/portfolio which stay float64; everything is computed in float64, so with the default
+        # dtype the kept columns are identical to the normal mode and the metrics are always exact.
+        # Memory ceiling: run() plus evaluate_performance on n rows peak under (8 + number of kept columns)
+        # * n * 8 bytes on top of the input, about 2x the size of a DatetimeIndex OHLCV input with the default
+        # columns. Measured on 300k bars: 64 bytes per row with the default columns (1.3x the input, 2.4x for
+        # the normal mode), 80 with them as float32 and 64 keeping strategy_return only, where run() itself
+        # computes the metrics next to the kept columns.
+        #
+        # execution (execution.ExecutionSimulator) replaces _simulate_trades with an event-driven simulation
+        # of order latency and volume-capped partial fills, position then holds the filled position and
+        # target_position the one the strategy asked for.
+        #
+        # resume_from (a checkpoint() state, see resume()) makes data the bars that follow the checkpointed run:
+        # the rolling windows restart from the carried raw tail and the signal shift, position, cash sums,
+        # portfolio and the performance metrics' running state continue from the carried values, so self.data
+        # only holds the new rows.
+        #
+        # regime_gate (e.g. regimes.RegimeGate) is called with the prepared frame and returns a boolean array,
+        # entry signals on bars where it is False are dropped before the latency shift.
+        if lean and prepared:
+            raise ValueError("lean mode computes its own features, it cannot take prepared data")
+        if lean and execution is not None:
+            raise ValueError("lean mode fills at the close, it cannot run an execution simulator")
+        if resume_from is not None and (lean or prepared or execution is not None):
+            raise ValueError("resuming needs the raw bars and the close fills of the normal mode")
+        if regime_gate is not None and (lean or resume_from is not None):
+            raise ValueError("the regime gate labels the whole prepared frame, it runs in the normal mode only")
+        self.regime_gate = regime_gate
+        self.execution = execution
+        self.lean = lean
+        self.columns = list(columns)
+        unknown = set(self.columns).difference(OUTPUT_COLUMNS, data.columns)
+        if lean and unknown:
+            raise KeyError(f"lean mode cannot keep columns {sorted(unknown)}")
+        self.dtype = np.dtype(dtype)
+        self.metrics = None # lean mode only, set by run() when a column performance_metrics needs is not kept
+        self.data = data if lean else data.copy(deep=not prepared)
+        self.instrument = instrument
         self.lookback = lookback
         self.entry_z = entry_z
         self.exit_z = exit_z
@@ -17,24 +249,89 @@ class MeanReversionBacktester:
         self.volatility_lookback = volatility_lookback
         self.capital = capital
         self.max_vol = max_vol
-        self._prepare_data()
+        self.resume_from = resume_from
+        self.history = max(lookback, volatility_lookback + 1) # raw rows the rolling windows look back over
+        self._raw_tail = None if prepared or lean else data.iloc[-self.history:].copy()
+        self._carry = None # end of run state, set by _generate_signals and _simulate_trades
+        self._bars = len(data) + (resume_from['bars'] if resume_from is not None else 0) # raw bars up to data's last
+        self._first_bar = 0 # bar number of self.data's first raw row, window_mean_std's segments are aligned on it
+        if resume_from is not None:
+            tail = resume_from['tail']
+            if len(tail) and len(data) and data.index[0] <= tail.index[-1]:
+                raise ValueError(f"resumed bars must start after {tail.index[-1]}, got {data.index[0]}")
+            self.data = pd.concat([tail, data])
+            self._first_bar = resume_from['bars'] - len(tail)
+            self._raw_tail = self.data.iloc[-self.history:].copy()
+        if not prepared and not lean:
+            with self._stage('q1._prepare_data'):
+                self._prepare_data()
+        if resume_from is not None and len(tail):
+            self.data = self.data.iloc[self.data.index.searchsorted(tail.index[-1], side='right'):].copy()
 
-    def _prepare_data(self):
-        self.data['returns'] = self.data['close'].pct_change()
-        self.data['mean'] = self.data['close'].rolling(self.lookback).mean()
-        self.data['std'] = self.data['close'].rolling(self.lookback).std()
-        self.data['zscore'] = (self.data['close'] - self.data['mean']) / self.data['std']
-        self.data['volatility'] = (
-            self.data['returns'].rolling(self.volatility_lookback).std() * np.sqrt(252 * 390)
+    @classmethod
+    def resume(cls, state, data, instrument=None):
+        # backtester over the bars that follow a checkpoint(), with the checkpointed parameters.
+        # After run() its data equals the new rows of a full run over all the bars exactly: the rolling statistics
+        # (window_mean_std, aligned on the carried bar count) only depend on the carried raw tail, the rest
+        # continues from the carried values. evaluate_performance() reports the metrics of all the bars so far,
+        # equal to the full run's except for the last bits of Turnover; its plot only shows the new rows
+        return cls(data, **state['params'], instrument=instrument, resume_from=state)
+
+    def checkpoint(self, data=None):
+        # compact state after run() from which resume() continues: the last `history` raw bars and the number of
+        # bars so far, the signals still inside the latency shift, the running position/cash/portfolio values
+        # and the performance_state of every row so far. Backtesters made from prepared data need the raw bars
+        # they were prepared from as `data`
+        if self.lean or self.execution is not None:
+            raise ValueError("only the normal mode without an execution simulator can be checkpointed")
+        if self.latency < 0:
+            raise ValueError("a negative latency looks ahead, its signals cannot be continued")
+        if self.regime_gate is not None:
+            raise ValueError("regime gated runs cannot be checkpointed, the labels' rolling windows are not carried")
+        if self._carry is None or 'portfolio' not in self._carry:
+            raise ValueError("checkpoint() needs a finished run()")
+        tail = self._raw_tail if data is None else data.iloc[-self.history:].copy()
+        if tail is None:
+            raise ValueError("the backtester was built from prepared data, pass the raw bars")
+        rows = len(self.data) + (self.resume_from['rows'] if self.resume_from is not None else 0)
+        bars = self._bars if data is None else len(data)
+        performance = performance_state(
+            self.data['strategy_return'], self.data['position'], self.data['position_change'], self._performance_carried()
         )
-        self.data.dropna(inplace=True)
+        return dict(
+            self._carry, params={name: getattr(self, name) for name in CHECKPOINT_PARAMS}, tail=tail, rows=rows,
+            bars=bars, performance=performance
+        )
+
+    def _performance_carried(self):
+        return None if self.resume_from is None else self.resume_from['performance']
+
+    def _stage(self, name):
+        # self.data is looked up when the stage ends too, lean mode replaces it with the kept columns
+        return NO_STAGE if self.instrument is None else self.instrument.stage(name, lambda: self.data)
+
+    def _prepare_data(self):
+        add_rolling_features(self.data, self.lookback, self.volatility_lookback, start=self._first_bar)
 
     def _generate_signals(self):
         self.data['signal'] = 0
         self.data.loc[self.data['zscore'] < self.entry_z, 'signal'] = 1
         self.data.loc[self.data['zscore'] > self.exit_z, 'signal'] = 0
-        self.data['signal'] = self.data['signal'].ffill().shift(self.latency)
-        self.data['signal'] = self.data['signal'].fillna(0)
+        if self.regime_gate is not None:
+            self.data.loc[~np.asarray(self.regime_gate(self.data), dtype=bool), 'signal'] = 0
+        pending = max(self.latency, 0) # signals the shift has not reached by the last bar
+        if self.resume_from is None:
+            self.data['signal'] = self.data['signal'].ffill()
+            values = self.data['signal'].to_numpy(dtype=np.float64)
+            signals = np.concatenate([np.zeros(pending), values[max(len(values) - pending, 0):]]) # zeros as fillna(0)
+        else:
+            signals = np.concatenate([self.resume_from['signals'], self.data['signal'].to_numpy(dtype=np.float64)])
+        self._carry = {'signals': signals[len(signals) - pending:]}
+        if self.resume_from is None:
+            self.data['signal'] = self.data['signal'].shift(self.latency)
+            self.data['signal'] = self.data['signal'].fillna(0)
+        elif pending: # without latency the signals are already in place, with their integer dtype
+            self.data['signal'] = signals[:len(self.data)]
 
     def _volatility_scaling(self):
         self.data['vol_scaled_position'] = (
@@ -45,7 +342,11 @@ class MeanReversionBacktester:
         self.data['position'] = self.data['signal'] * self.data['vol_scaled_position']
 
     def _simulate_trades(self):
-        self.data['position_change'] = self.data['position'].diff().fillna(0)
+        carried = self.resume_from if self.resume_from is not None and self.resume_from['position'] is not None else None
+        self.data['position_change'] = self.data['position'].diff()
+        if carried is not None and len(self.data):
+            self.data.iloc[0, self.data.columns.get_loc('position_change')] = self.data['position'].iloc[0] - carried['position']
+        self.data['position_change'] = self.data['position_change'].fillna(0)
         trade_direction = np.sign(self.data['position_change'])
         self.data['trade_price'] = self.data['close'] * (
             1 + self.slippage * trade_direction
@@ -55,52 +356,195 @@ class MeanReversionBacktester:
             (self.data['trade_price'] * self.data['position_change'].abs()) * self.fee
         )
         self.data['holdings'] = self.data['position'] * self.data['close']
-        self.data['cash'] = self.capital - (
-            (self.data['trade_price'] * self.data['position_change']).cumsum() +
-            self.data['transaction_cost'].cumsum()
+        last = self.resume_from or {'position': None, 'traded': 0.0, 'costs': 0.0, 'portfolio': self.capital}
+        traded = _cumsum(self.data['trade_price'] * self.data['position_change'], carried and carried['traded'])
+        costs = _cumsum(self.data['transaction_cost'], carried and carried['costs'])
+        if len(self.data):
+            last = {'position': self.data['position'].iloc[-1], 'traded': traded.iloc[-1], 'costs': costs.iloc[-1]}
+        self.data['cash'] = self.capital - (traded + costs)
+        del traded, costs
+        self.data['portfolio'] = self.data['cash'] + self.data['holdings']
+        if carried is None:
+            self.data['strategy_return'] = self.data['portfolio'].pct_change().fillna(0)
+        else:
+            strategy_return = self.data['portfolio'].pct_change()
+            if len(self.data):
+                strategy_return.iloc[0] = self.data['portfolio'].iloc[0] / carried['portfolio'] - 1
+            self.data['strategy_return'] = strategy_return.fillna(0)
+        self._carry.update(
+            position=last['position'], traded=last['traded'], costs=last['costs'],
+            portfolio=self.data['portfolio'].iloc[-1] if len(self.data) else last['portfolio'],
         )
+
+    def _simulate_execution(self):
+        target = self.data['position']
+        filled, notional, cost = self.execution.simulate(
+            self.data['close'], self.data['volume'], target, self.slippage, self.fee, self.data.index
+        )
+        self.data['target_position'] = target
+        self.data['position'] = np.cumsum(filled)
+        self.data['position_change'] = filled
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.data['trade_price'] = np.where(filled != 0, notional / filled, self.data['close'])
+        self.data['transaction_cost'] = cost
+        self.data['holdings'] = self.data['position'] * self.data['close']
+        self.data['cash'] = self.capital - (np.cumsum(notional) + np.cumsum(cost))
         self.data['portfolio'] = self.data['cash'] + self.data['holdings']
         self.data['strategy_return'] = self.data['portfolio'].pct_change().fillna(0)
 
+    def _run_lean(self):
+        source = self.data
+        keep = set(self.columns)
+        kept = {}
+
+        def stash(name, values, rows=None, last_use=False):
+            # stores the kept columns, copied since the arrays are reused afterwards unless last_use says
+            # they are never written again
+            if name in keep:
+                values = values if rows is None else values[rows]
+                dtype = np.float64 if name in ACCOUNTING_COLUMNS else self.dtype
+                kept[name] = values.astype(dtype, copy=rows is None and not last_use)
+
+        # same rolling statistics as add_rolling_features, on the full series before the NaN rows go
+        close = source['close'].astype(np.float64, copy=False)
+        returns = close.pct_change().to_numpy()
+        volatility = window_mean_std(returns, self.volatility_lookback)[1]
+        volatility *= np.sqrt(252 * 390)
+        close = close.to_numpy()
+        mean, std = window_mean_std(close, self.lookback)
+        zscore = np.subtract(close, mean, out=None if 'mean' in keep else mean)
+        np.divide(zscore, std, out=zscore)
+
+        valid = ~(np.isnan(returns) | np.isnan(zscore) | np.isnan(volatility)) # the rows dropna keeps
+        if source.shape[1] > 1:
+            valid &= source.notna().all(axis=1).to_numpy()
+        for name, values in (('returns', returns), ('mean', mean), ('std', std), ('zscore', zscore), ('volatility', volatility)):
+            stash(name, values, valid)
+        for name in keep.difference(kept, ('close',)).intersection(source.columns):
+            kept[name] = source[name].to_numpy()[valid]
+        del returns, mean, std # zscore may live in the mean buffer, which then goes with it below
+        index = source.index[valid]
+        close = close[valid]
+        zscore = zscore[valid]
+        scratch = volatility[valid]
+        del volatility, valid
+        stash('close', close, last_use=True)
+
+        # _generate_signals
+        position = np.zeros(len(close))
+        position[zscore < self.entry_z] = 1
+        position[zscore > self.exit_z] = 0
+        del zscore
+        if self.latency > 0:
+            position[self.latency:] = position[:-self.latency]
+            position[:self.latency] = 0
+        elif self.latency < 0:
+            position[:self.latency] = position[-self.latency:]
+            position[self.latency:] = 0
+        stash('signal', position)
+
+        # _volatility_scaling, vol_scaled_position overwrites the volatility
+        with np.errstate(divide='ignore'):
+            np.divide(self.capital * self.max_vol, scratch, out=scratch)
+        np.minimum(scratch, self.capital, out=scratch)
+        np.divide(scratch, close, out=scratch)
+        scratch[np.isnan(scratch)] = 0
+        stash('vol_scaled_position', scratch)
+        position *= scratch
+        stash('position', position, last_use=True)
+
+        # _simulate_trades
+        change = np.empty_like(position)
+        change[:1] = 0
+        np.subtract(position[1:], position[:-1], out=change[1:])
+        stash('position_change', change, last_use=True)
+        trade_price = np.sign(change, out=scratch)
+        trade_price *= self.slippage
+        trade_price += 1
+        trade_price *= close
+        stash('trade_price', trade_price)
+        cost = np.abs(change)
+        cost *= trade_price
+        cost *= self.fee
+        stash('transaction_cost', cost)
+        cash = np.multiply(trade_price, change, out=trade_price)
+        del trade_price, scratch
+        np.cumsum(cash, out=cash)
+        np.cumsum(cost, out=cost)
+        cash += cost
+        np.subtract(self.capital, cash, out=cash)
+        stash('cash', cash)
+        holdings = np.multiply(position, close, out=cost)
+        del cost
+        stash('holdings', holdings)
+        portfolio = np.add(cash, holdings, out=cash)
+        del cash
+        stash('portfolio', portfolio, last_use=True)
+        strategy_return = holdings
+        strategy_return[:1] = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(portfolio[1:], portfolio[:-1], out=strategy_return[1:])
+        strategy_return[1:] -= 1
+        strategy_return[np.isnan(strategy_return)] = 0
+        stash('strategy_return', strategy_return, last_use=True)
+        del close, portfolio # only the three arrays the metrics read stay besides the kept columns
+
+        if keep.issuperset(('position', 'position_change', 'strategy_return')) and self.dtype == np.float64:
+            self.metrics = None # evaluate_performance reads the kept columns
+        else:
+            self.metrics = performance_metrics(
+                pd.Series(strategy_return, index=index, copy=False), pd.Series(position, index=index, copy=False),
+                pd.Series(change, index=index, copy=False)
+            )
+        self.data = pd.DataFrame({name: kept[name] for name in self.columns}, index=index, copy=False)
+        return self.data
+
     def run(self):
-        self._generate_signals()
-        self._volatility_scaling()
-        self._simulate_trades()
+        if self.lean:
+            with self._stage('q1._run_lean'):
+                return self._run_lean()
+        with self._stage('q1._generate_signals'):
+            self._generate_signals()
+        with self._stage('q1._volatility_scaling'):
+            self._volatility_scaling()
+        if self.execution is not None:
+            with self._stage('q1._simulate_execution'):
+                self._simulate_execution()
+        else:
+            with self._stage('q1._simulate_trades'):
+                self._simulate_trades()
         return self.data
 
-    def evaluate_performance(self, plot=True):
-        df = self.data.copy()
-        cum_returns = (1 + df['strategy_return']).cumprod()
-        daily_returns = df['strategy_return'].resample('1D').sum()
-        sharpe = np.sqrt(252) * daily_returns.mean() / daily_returns.std() if daily_returns.std() > 0 else np.nan
-        roll_max = cum_returns.cummax()
-        drawdown = (cum_returns - roll_max) / roll_max
-        max_drawdown = drawdown.min()
-        days = (df.index[-1] - df.index[0]).days
-        cagr = (cum_returns.iloc[-1]) ** (365 / days) - 1 if days > 0 else np.nan
-        avg_gross_position = df['position'].abs().mean()
-        total_traded = df['position_change'].abs().sum()
-        turnover = total_traded / avg_gross_position if avg_gross_position > 0 else np.nan
-        hit_rate = (df['strategy_return'] > 0).sum() / (df['strategy_return'] != 0).sum() if (df['strategy_return'] != 0).sum() > 0 else np.nan
-
-        print(f"Sharpe Ratio: {sharpe:.2f}")
-        print(f"Max Drawdown: {max_drawdown:.2%}")
-        print(f"CAGR: {cagr:.2%}")
-        print(f"Turnover: {turnover:.2f}")
-        print(f"Hit Rate: {hit_rate:.2%}")
+    def evaluate_performance(self, plot=True, verbose=True):
+        with self._stage('q1.evaluate_performance'):
+            df = self.data # only read, so no copy
+            if self.metrics is not None:
+                metrics = self.metrics
+            else:
+                metrics = performance_metrics(
+                    df['strategy_return'], df['position'], df['position_change'], self._performance_carried()
+                )
+
+        if verbose:
+            print(f"Sharpe Ratio: {metrics['Sharpe']:.2f}")
+            print(f"Max Drawdown: {metrics['Max Drawdown']:.2%}")
+            print(f"CAGR: {metrics['CAGR']:.2%}")
+            print(f"Turnover: {metrics['Turnover']:.2f}")
+            print(f"Hit Rate: {metrics['Hit Rate']:.2%}")
 
         if plot:
-            self._plot_performance(cum_returns, drawdown, sharpe, cagr, turnover, hit_rate, max_drawdown)
+            if 'strategy_return' not in df:
+                raise ValueError("plotting needs the strategy_return column, keep it in lean mode")
+            cum_returns, drawdown = equity_curve(df['strategy_return'])
+            self._plot_performance(
+                cum_returns, drawdown, metrics['Sharpe'], metrics['CAGR'], metrics['Turnover'],
+                metrics['Hit Rate'], metrics['Max Drawdown']
+            )
 
-        return {
-            "Sharpe": sharpe,
-            "Max Drawdown": max_drawdown,
-            "CAGR": cagr,
-            "Turnover": turnover,
-            "Hit Rate": hit_rate
-        }
+        return metrics
 
     def _plot_performance(self, cum_returns, drawdown, sharpe, cagr, turnover, hit_rate, max_drawdown):
+        import matplotlib.pyplot as plt # only needed for plotting, keeps headless runs (sweeps, workers) light
         plt.figure(figsize=(14, 7))
         plt.subplot(2, 1, 1)
         plt.plot(cum_returns.index, cum_returns, label="Equity Curve")
@@ -135,25 +579,25 @@ class MeanReversionBacktester:
 
 
 #Example
+if __name__ == "__main__":
+    np.random.seed(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=1560, freq="T")  # 4 trading days
 
-np.random.seed(123)
-minutes = pd.date_range("2025-01-01 09:30", periods=1560, freq="T")  # 4 trading days
-
-# Sinusoidal mean-reverting process with drift and noise
-base = 100 + np.linspace(0, 2, len(minutes))  # upward drift
-oscillation = 2 * np.sin(np.linspace(0, 20 * np.pi, len(minutes)))  # oscillation
-noise = np.random.normal(0, 0.2, len(minutes))  # adding noise
-price = base + oscillation + noise
+    # Sinusoidal mean-reverting process with drift and noise
+    base = 100 + np.linspace(0, 2, len(minutes))  # upward drift
+    oscillation = 2 * np.sin(np.linspace(0, 20 * np.pi, len(minutes)))  # oscillation
+    noise = np.random.normal(0, 0.2, len(minutes))  # adding noise
+    price = base + oscillation + noise
 
-data = pd.DataFrame(index=minutes)
-data['close'] = price
-data['open'] = data['close'].shift(1).fillna(method='bfill')
-data['high'] = data[['open', 'close']].max(axis=1) + np.abs(np.random.normal(0, 0.05, size=len(minutes)))
-data['low'] = data[['open', 'close']].min(axis=1) - np.abs(np.random.normal(0, 0.05, size=len(minutes)))
-data['volume'] = np.random.randint(100, 1000, size=len(minutes))
+    data = pd.DataFrame(index=minutes)
+    data['close'] = price
+    data['open'] = data['close'].shift(1).fillna(method='bfill')
+    data['high'] = data[['open', 'close']].max(axis=1) + np.abs(np.random.normal(0, 0.05, size=len(minutes)))
+    data['low'] = data[['open', 'close']].min(axis=1) - np.abs(np.random.normal(0, 0.05, size=len(minutes)))
+    data['volume'] = np.random.randint(100, 1000, size=len(minutes))
 
 
 
-bt = MeanReversionBacktester(data)
-bt.run()
-bt.evaluate_performance()
+    bt = MeanReversionBacktester(data)
+    bt.run()
+    bt.evaluate_performance()
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+from resampling import log_growth
+
+# Market regimes for MeanReversionBacktester: every bar is labelled from its volatility and, optionally, its
+# trend strength, and performance is broken down per regime.
+#
+# Labels (label_regimes) come from one pass of pandas' rolling rank: the percentile of the bar's volatility
+# within the trailing `window` bars is bucketed by `quantiles`, which is the same as comparing it against the
+# rolling quantile thresholds but costs one rolling pass whatever the number of buckets. Trend strength is
+# the efficiency ratio |close - close L bars ago| / sum of the L absolute bar moves (1 = straight line,
+# ~0 = noise) from prefix sums, bars at or above trend_threshold are 'trend' and the rest 'range'.
+# Codes are int8, -1 while the windows are still filling. Series give one label per bar, DataFrames
+# (bars x symbols panels) one per bar and symbol, every column on its own history.
+#
+# regime_metrics reduces a backtest per regime without filtering it once per regime: all bars are reduced
+# with np.bincount on their group code (regime, or symbol * regimes + regime for a panel):
+#   Sharpe        sqrt(252) * mean / std of the daily summed returns, over the days the regime occurred
+#   Max Drawdown  on the equity compounded over the regime's bars only, the bars are stably sorted by group and
+#                 the running peak of every group comes from one np.maximum.accumulate after adding an offset
+#                 per group larger than the spread of the log equity, so no group sees another's peak
+#   Turnover      traded / average gross position, Hit Rate winning / non zero bars, as in performance_metrics
+#
+# RegimeGate plugs a regime filter into MeanReversionBacktester(regime_gate=...): entries are only taken in the
+# allowed regimes and the strategy is flat in the others (and while the labels are still warming up).
+
+VOLATILITY_NAMES = {2: ('low_vol', 'high_vol'), 3: ('low_vol', 'mid_vol', 'high_vol')}
+
+def regime_names(n_quantiles=2, trend=False):
+    # name of every code label_regimes returns for that many quantile thresholds
+    buckets = n_quantiles + 1
+    volatility = VOLATILITY_NAMES.get(buckets, tuple(f"vol_{bucket}" for bucket in range(buckets)))
+    if not trend:
+        return list(volatility)
+    return [f"{name}/{kind}" for name in volatility for kind in ('range', 'trend')]
+
+def efficiency_ratio(close, lookback):
+    # |close - close lookback bars ago| / sum of the absolute bar moves in between, NaN for the first bars and
+    # wherever either close is NaN (e.g. before a symbol of a ragged panel starts)
+    values = np.asarray(close, dtype=np.float64)
+    moves = np.zeros(values.shape)
+    np.abs(values[1:] - values[:-1], out=moves[1:])
+    moves[np.isnan(moves)] = 0.0 # a NaN close must not poison the prefix sum of every later bar
+    path = np.cumsum(moves, axis=0)
+    ratio = np.full(values.shape, np.nan)
+    change = np.abs(values[lookback:] - values[:-lookback])
+    travelled = path[lookback:] - path[:-lookback]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio[lookback:] = change / travelled
+    ratio[lookback:][(travelled == 0) & ~np.isnan(change)] = 0.0 # flat price, no trend
+    return ratio
+
+def label_regimes(volatility, close=None, window=390 * 20, quantiles=(1 / 3, 2 / 3), trend_lookback=None,
+                  trend_threshold=0.3, min_periods=None):
+    # returns (codes, names): int8 codes shaped like volatility (Series or bars x symbols DataFrame), -1 where
+    # unlabelled, and the name of every code. close and trend_lookback add the trend / range split
+    quantiles = np.sort(np.asarray(quantiles, dtype=np.float64))
+    rank = volatility.rolling(window, min_periods=min_periods or window).rank(pct=True).to_numpy()
+    codes = np.searchsorted(quantiles, rank, side='left').astype(np.int8)
+    unlabelled = np.isnan(rank)
+    trend = trend_lookback is not None
+    if trend:
+        if close is None:
+            raise ValueError("the trend split needs the close prices")
+        ratio = efficiency_ratio(close, trend_lookback)
+        codes *= 2
+        codes += ratio >= trend_threshold
+        unlabelled |= np.isnan(ratio)
+    codes[unlabelled] = -1
+    if isinstance(volatility, pd.DataFrame):
+        labels = pd.DataFrame(codes, index=volatility.index, columns=volatility.columns)
+    else:
+        labels = pd.Series(codes, index=volatility.index, name='regime')
+    return labels, regime_names(len(quantiles), trend)
+
+def _day_codes(index):
+    # 0, 1, 2, ... per calendar day of a sorted DatetimeIndex, in its own timezone like resample('1D')
+    days = index.normalize().asi8
+    codes = np.zeros(len(days), dtype=np.int64)
+    np.cumsum(days[1:] != days[:-1], out=codes[1:])
+    return codes
+
+def _grouped_metrics(returns, position, change, days, groups, n_groups, days_per_year=252):
+    # metric arrays per group code, bars with a negative code are left out
+    keep = groups >= 0
+    returns, position, change, days, groups = returns[keep], position[keep], change[keep], days[keep], groups[keep]
+    bars = np.bincount(groups, minlength=n_groups)
+
+    n_days = int(days.max()) + 1 if len(days) else 1
+    daily_key = groups * n_days + days
+    daily = np.bincount(daily_key, weights=returns, minlength=n_groups * n_days).reshape(n_groups, n_days)
+    active = np.bincount(daily_key, minlength=n_groups * n_days).reshape(n_groups, n_days) > 0
+    active_days = active.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_mean = daily.sum(axis=1) / active_days
+        deviations = np.where(active, daily - daily_mean[:, None], 0.0)
+        daily_std = np.sqrt((deviations * deviations).sum(axis=1) / (active_days - 1))
+        sharpe = np.where(daily_std > 0, np.sqrt(days_per_year) * daily_mean / daily_std, np.nan)
+
+    # drawdown on each group's own equity: groups made contiguous, log equity restarted at every group
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    log_equity = np.cumsum(log_growth(returns[order]))
+    starts = np.searchsorted(sorted_groups, np.arange(n_groups), side='left')
+    ends = np.searchsorted(sorted_groups, np.arange(n_groups), side='right')
+    before = np.concatenate([[0.0], log_equity])[starts] # log equity of the bars of earlier groups
+    log_equity -= np.repeat(before, bars)
+    offset = (log_equity.max() - log_equity.min() + 1.0) if len(log_equity) else 0.0
+    lifted = log_equity + sorted_groups * offset
+    peak = np.maximum.accumulate(lifted)
+    peak -= lifted
+    drawdown = np.expm1(-peak)
+    nonempty = bars > 0
+    max_drawdown = np.full(n_groups, np.nan)
+    max_drawdown[nonempty] = np.minimum.reduceat(drawdown, starts[nonempty]) if len(drawdown) else []
+    total_return = np.full(n_groups, np.nan)
+    total_return[nonempty] = np.expm1(log_equity[ends[nonempty] - 1])
+
+    gross = np.bincount(groups, weights=np.abs(position), minlength=n_groups)
+    traded = np.bincount(groups, weights=np.abs(change), minlength=n_groups)
+    wins = np.bincount(groups, weights=returns > 0, minlength=n_groups)
+    active_bars = np.bincount(groups, weights=returns != 0, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.where(gross > 0, traded / (gross / bars), np.nan)
+        hit_rate = np.where(active_bars > 0, wins / active_bars, np.nan)
+    return {
+        'Bars': bars,
+        'Share': bars / max(bars.sum(), 1),
+        'Sharpe': sharpe,
+        'Max Drawdown': max_drawdown,
+        'Total Return': total_return,
+        'Turnover': turnover,
+        'Hit Rate': hit_rate,
+    }
+
+def regime_metrics(strategy_return, position, position_change, regimes, names=None):
+    # per regime metrics of a backtest. Series inputs (e.g. bt.data columns and label_regimes codes) give one
+    # row per regime, bars x symbols DataFrames one row per (symbol, regime)
+    n_regimes = len(names) if names is not None else int(np.max(regimes.to_numpy(), initial=-1)) + 1
+    names = names if names is not None else [f"regime_{code}" for code in range(n_regimes)]
+    days = _day_codes(strategy_return.index)
+    if isinstance(strategy_return, pd.DataFrame):
+        n_symbols = strategy_return.shape[1]
+        columns = [frame.to_numpy(dtype=np.float64).T.ravel() for frame in (strategy_return, position, position_change)]
+        codes = regimes.to_numpy().T.ravel().astype(np.int64)
+        groups = np.where(codes >= 0, np.repeat(np.arange(n_symbols), len(days)) * n_regimes + codes, -1)
+        metrics = _grouped_metrics(*columns, np.tile(days, n_symbols), groups, n_symbols * n_regimes)
+        index = pd.MultiIndex.from_product([strategy_return.columns, names], names=['symbol', 'regime'])
+        table = pd.DataFrame(metrics, index=index)
+        table['Share'] = table['Bars'] / table.groupby(level='symbol')['Bars'].transform('sum').clip(lower=1)
+        return table
+    columns = [np.asarray(values, dtype=np.float64) for values in (strategy_return, position, position_change)]
+    metrics = _grouped_metrics(*columns, days, np.asarray(regimes, dtype=np.int64), n_regimes)
+    return pd.DataFrame(metrics, index=pd.Index(names, name='regime'))
+
+class RegimeGate:
+    # regime_gate for MeanReversionBacktester: called with the prepared frame, True where entries are allowed
+    def __init__(self, allowed, window=390 * 20, quantiles=(1 / 3, 2 / 3), trend_lookback=None, trend_threshold=0.3):
+        self.allowed = [allowed] if isinstance(allowed, str) else list(allowed)
+        self.window = window
+        self.quantiles = quantiles
+        self.trend_lookback = trend_lookback
+        self.trend_threshold = trend_threshold
+        names = regime_names(len(quantiles), trend_lookback is not None)
+        unknown = set(self.allowed).difference(names)
+        if unknown:
+            raise KeyError(f"unknown regimes {sorted(unknown)}, expected some of {names}")
+        self.codes = [names.index(name) for name in self.allowed]
+
+    def labels(self, data):
+        codes, _ = label_regimes(
+            data['volatility'], data['close'], self.window, self.quantiles, self.trend_lookback, self.trend_threshold
+        )
+        return codes
+
+    def __call__(self, data):
+        return np.isin(self.labels(data).to_numpy(), self.codes)
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(7)
+    minutes = pd.date_range("2025-01-01 09:30", periods=390 * 20, freq="min")
+    closes = pd.DataFrame(
+        100 + np.cumsum(rng.normal(0, 0.1, (len(minutes), 4)), axis=0), index=minutes, columns=['A', 'B', 'C', 'D']
+    )
+    closes.iloc[:2000, 1] = np.nan # ragged panel: B starts late, C stops early
+    closes.iloc[6000:, 2] = np.nan
+    volatility = closes.pct_change(fill_method=None).rolling(60).std()
+
+    # every column of a panel is labelled on its own history
+    start = time.perf_counter()
+    labels, names = label_regimes(volatility, closes, window=390 * 2, trend_lookback=30)
+    elapsed = time.perf_counter() - start
+    for symbol in closes:
+        listed = closes[symbol].notna().to_numpy()
+        alone, _ = label_regimes(
+            volatility[symbol][listed], closes[symbol][listed], window=390 * 2, trend_lookback=30
+        )
+        assert (labels[symbol][listed] == alone).all(), symbol
+        assert (labels[symbol][~listed] == -1).all(), symbol
+    print(f"panel labels match per symbol labelling, {labels.size:,} labels in {elapsed:.3f}s")
+    print(labels.apply(lambda codes: codes.value_counts()).rename(index=dict(enumerate(names))).to_string())
@@ -0,0 +1,323 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# Resampling tests for how much of a backtest's Sharpe / drawdown is luck.
+#
+# Path metrics (path_metrics) are computed per row of a (paths x bars) return array with batched numpy
+# reductions: Sharpe = mean / std * sqrt(periods_per_year), Max Drawdown = min of equity / running peak - 1
+# (negative, as in evaluate_performance), CAGR = equity ** (periods_per_year / bars) - 1 and Hit Rate =
+# winning bars / bars with a non zero return. Returns at or below -100% floor the equity at ~0.
+# These are per bar statistics: evaluate_performance's Sharpe is on daily sums and its CAGR on calendar days, which
+# a path of resampled bars does not have. significance therefore takes the observed returns and measures them with
+# path_metrics too, so the observed value and its distribution are always the same statistic.
+#
+# Two ways of generating paths:
+#   block bootstrap   circular blocks of block_size bars drawn with replacement, keeps the short range
+#                     autocorrelation. bootstrap_metrics never builds the paths: every possible block is
+#                     summarised once (sums, log growth, max/min of the log equity and its max drawdown), so a
+#                     path is a scan over its ~bars / block_size blocks. 10k paths of 1M bars take seconds and
+#                     the memory is bounded by chunk_paths. block_bootstrap_paths yields the same paths as 2-D
+#                     arrays (same seed, same paths) when the bars themselves are needed.
+#   shuffled signal   the strategy's exposure is circularly shifted against the asset returns by a random
+#                     offset. That keeps the signal's own structure but breaks its timing, the null hypothesis
+#                     of no skill.
+#
+# For parameter sweeps (sweep.run_sweep) deflate_sweep adds the probabilistic Sharpe ratio of every combination,
+# Holm / Benjamini-Hochberg adjusted p-values and the deflated Sharpe ratio (Bailey & Lopez de Prado), which
+# compares each Sharpe with the best one expected from that many trials of pure noise.
+
+PERIODS_PER_YEAR = 252 * 390 # minute bars, as in the volatility scaling of q1.py
+METRICS = ['Sharpe', 'Max Drawdown', 'CAGR', 'Hit Rate']
+MEMORY_BUDGET = 256 * 2**20 # bytes per chunk of paths
+EULER_GAMMA = 0.5772156649015329
+NORMAL = NormalDist()
+TINY_LOG = np.log(np.finfo(np.float64).tiny) # log growth of a bar that wiped the equity out
+
+def log_growth(returns):
+    # log(1 + returns) per bar, the log equity is its cumsum. Bars losing 100% or more floor at TINY_LOG
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.fmax(np.log1p(returns), TINY_LOG) # fmax: log1p of a loss beyond -100% is NaN
+
+def _finish(n_bars, total, total_sq, wins, active, log_total, max_dd_log, periods_per_year):
+    mean = total / n_bars
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(np.maximum(total_sq - total * mean, 0) / (n_bars - 1))
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), np.nan)
+        hit_rate = np.where(active > 0, wins / active, np.nan)
+    return pd.DataFrame({
+        'Sharpe': sharpe,
+        'Max Drawdown': np.expm1(-max_dd_log),
+        'CAGR': np.expm1(log_total * (periods_per_year / n_bars)),
+        'Hit Rate': hit_rate,
+    })
+
+def path_metrics(paths, periods_per_year=PERIODS_PER_YEAR):
+    # paths: (paths x bars) array of per bar returns, one row of metrics per path
+    paths = np.atleast_2d(np.asarray(paths, dtype=np.float64))
+    log_equity = np.cumsum(log_growth(paths), axis=1)
+    peak = np.maximum.accumulate(log_equity, axis=1)
+    np.maximum(peak, 0, out=peak) # the equity starts at 1
+    peak -= log_equity
+    return _finish(
+        paths.shape[1], paths.sum(axis=1), np.einsum('ij,ij->i', paths, paths), (paths > 0).sum(axis=1),
+        (paths != 0).sum(axis=1), log_equity[:, -1], peak.max(axis=1), periods_per_year
+    )
+
+def default_block_size(n_bars):
+    return max(1, int(round(n_bars ** (1 / 3))))
+
+def _chunk_paths(per_path_bytes, chunk_paths):
+    return chunk_paths or max(1, MEMORY_BUDGET // max(per_path_bytes, 1))
+
+def _chunks(n_paths, per_path_bytes, chunk_paths):
+    chunk_paths = _chunk_paths(per_path_bytes, chunk_paths)
+    for start in range(0, n_paths, chunk_paths):
+        yield min(chunk_paths, n_paths - start)
+
+def _path_seeds(seed, n_paths, chunk_paths):
+    # one seed per path, so a path does not depend on how the paths are chunked
+    seeds = np.random.SeedSequence(seed).spawn(n_paths)
+    for start in range(0, n_paths, chunk_paths):
+        yield seeds[start:start + chunk_paths]
+
+def _block_starts(seeds, n_bars, block_size):
+    # (paths x blocks) random block starts, the last column starts the partial block (rows n_bars.. of the
+    # block table) when block_size does not divide n_bars
+    full, tail = divmod(n_bars, block_size)
+    starts = np.empty((len(seeds), full + (tail > 0)), dtype=np.int64)
+    for row, seed in zip(starts, seeds):
+        rng = np.random.default_rng(seed)
+        row[:full] = rng.integers(0, n_bars, full)
+        if tail:
+            row[full] = rng.integers(0, n_bars) + n_bars
+    return starts
+
+def block_bootstrap_paths(returns, n_paths, block_size=None, seed=0, chunk_paths=None):
+    # yields (chunk x bars) arrays of circular block bootstrap paths
+    returns = np.asarray(returns, dtype=np.float64)
+    n_bars = len(returns)
+    block_size = block_size or default_block_size(n_bars)
+    full, tail = divmod(n_bars, block_size)
+    offsets = np.arange(block_size)
+    for seeds in _path_seeds(seed, n_paths, _chunk_paths(n_bars * 16, chunk_paths)):
+        starts = _block_starts(seeds, n_bars, block_size)
+        index = (starts[:, :full, None] + offsets).reshape(len(seeds), -1)
+        if tail:
+            index = np.concatenate([index, starts[:, full:] - n_bars + offsets[:tail]], axis=1)
+        yield returns[index % n_bars]
+
+def _window_extremes(levels, steps):
+    # max, min and largest drop (max over u <= t of levels[u] - levels[t]) of levels[s:s + steps + 1] for every s,
+    # built by doubling windows of 1, 2, 4, .. steps and joining the ones in the binary expansion of steps
+    high = np.maximum(levels[:-1], levels[1:])
+    low = np.minimum(levels[:-1], levels[1:])
+    drop = np.maximum(levels[:-1] - levels[1:], 0)
+    width = 1
+    joined = None
+    while True:
+        if steps & width:
+            if joined is None:
+                joined = high, low, drop
+            else:
+                # this window first, then the already joined lower bits
+                after_high, after_low, after_drop = (values[width:] for values in joined)
+                count = len(after_high)
+                joined = (
+                    np.maximum(high[:count], after_high), np.minimum(low[:count], after_low),
+                    np.maximum(np.maximum(drop[:count], after_drop), high[:count] - after_low)
+                )
+        width *= 2
+        if width > steps:
+            return joined
+        half = width // 2
+        high, low, drop = (
+            np.maximum(high[:-half], high[half:]), np.minimum(low[:-half], low[half:]),
+            np.maximum(np.maximum(drop[:-half], drop[half:]), high[:-half] - low[half:])
+        )
+
+def block_table(returns, block_size):
+    # (bars x 8) summary of the circular block of block_size bars starting at every bar:
+    # sum, sum of squares, wins, active bars, log growth, max and min of the log equity relative to the block
+    # start (including the start) and the largest drop of the log equity inside the block
+    n_bars = len(returns)
+    wrapped = np.concatenate([returns, returns[:block_size - 1]]) if block_size > 1 else returns
+
+    def window_sums(values):
+        sums = np.concatenate([[0], np.cumsum(values)])
+        return sums[block_size:block_size + n_bars] - sums[:n_bars]
+
+    levels = np.concatenate([[0], np.cumsum(log_growth(wrapped))])
+    high, low, drop = _window_extremes(levels, block_size)
+    return np.column_stack([
+        window_sums(wrapped), window_sums(wrapped * wrapped), window_sums(wrapped > 0), window_sums(wrapped != 0),
+        levels[block_size:block_size + n_bars] - levels[:n_bars],
+        high[:n_bars] - levels[:n_bars], low[:n_bars] - levels[:n_bars], drop[:n_bars]
+    ])
+
+def _scan_blocks(table, seeds, n_bars, block_size, periods_per_year):
+    starts = _block_starts(seeds, n_bars, block_size)
+    blocks = np.take(table, starts, axis=0) # (paths x blocks x 8), take is much faster than fancy indexing here
+    totals = blocks[:, :, :4].sum(axis=1, dtype=np.float64)
+    growth, high, low, drop = (blocks[:, :, column] for column in range(4, 8))
+    level = np.cumsum(growth, axis=1, dtype=np.float64) # log equity at the end of every block
+    start_level = level - growth
+    peak = start_level + high
+    np.maximum.accumulate(peak, axis=1, out=peak) # running peak at the end of every block
+    np.maximum(peak, 0, out=peak)
+    dd = np.add(start_level, low, out=start_level)
+    np.subtract(peak[:, :-1], dd[:, 1:], out=dd[:, 1:]) # drop from the peak before a block to its low
+    np.negative(dd[:, 0], out=dd[:, 0])
+    np.maximum(dd, drop, out=dd)
+    return _finish(n_bars, *totals.T, level[:, -1], dd.max(axis=1), periods_per_year)
+
+def bootstrap_metrics(returns, n_paths=10_000, block_size=None, seed=0, chunk_paths=None,
+                      periods_per_year=PERIODS_PER_YEAR, center=False, n_jobs=None):
+    # metrics of n_paths circular block bootstrap paths of returns, one row per path. center=True removes the
+    # mean first, which makes the distribution the null of no edge to test an observed Sharpe against.
+    # The block table is float32 (half the memory traffic of the random gathers), which leaves ~1e-7 relative
+    # rounding in the metrics, far below their Monte Carlo error. Chunks run on n_jobs threads, numpy
+    # releases the GIL in the gathers and scans.
+    returns = np.asarray(returns, dtype=np.float64)
+    if center:
+        returns = returns - returns.mean()
+    n_bars = len(returns)
+    block_size = block_size or default_block_size(n_bars)
+    full, tail = divmod(n_bars, block_size)
+    table = block_table(returns, block_size)
+    if tail: # the partial last block of every path comes from rows n_bars.. of the same table
+        table = np.concatenate([table, block_table(returns, tail)])
+    table = table.astype(np.float32)
+    chunks = _path_seeds(seed, n_paths, _chunk_paths((full + 1) * 8 * 8, chunk_paths))
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1:
+        parts = [_scan_blocks(table, seeds, n_bars, block_size, periods_per_year) for seeds in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(
+                lambda seeds: _scan_blocks(table, seeds, n_bars, block_size, periods_per_year), chunks
+            ))
+    return pd.concat(parts, ignore_index=True)
+
+def exposure_and_returns(data):
+    # (exposure, asset returns) of a MeanReversionBacktester.run() frame: the share of the portfolio held
+    # over each bar and the close to close return of that bar
+    exposure = (data['holdings'] / data['portfolio']).shift(1).fillna(0).to_numpy()
+    asset_returns = data['close'].pct_change().fillna(0).to_numpy()
+    return exposure, asset_returns
+
+def shuffled_signal_paths(exposure, asset_returns, n_paths, seed=0, chunk_paths=None):
+    # yields (chunk x bars) arrays of exposure shifted by a random 1 .. bars-1 bars times the asset returns
+    exposure = np.asarray(exposure, dtype=np.float64)
+    asset_returns = np.asarray(asset_returns, dtype=np.float64)
+    n_bars = len(asset_returns)
+    rng = np.random.default_rng(seed)
+    bars = np.arange(n_bars)
+    for size in _chunks(n_paths, n_bars * 16, chunk_paths):
+        shifts = rng.integers(1, max(n_bars, 2), size)
+        yield exposure[(bars - shifts[:, None]) % n_bars] * asset_returns
+
+def shuffled_signal_metrics(exposure, asset_returns, n_paths=1_000, seed=0, chunk_paths=None,
+                            periods_per_year=PERIODS_PER_YEAR):
+    return pd.concat([
+        path_metrics(paths, periods_per_year)
+        for paths in shuffled_signal_paths(exposure, asset_returns, n_paths, seed, chunk_paths)
+    ], ignore_index=True)
+
+def significance(returns, distribution, periods_per_year=PERIODS_PER_YEAR):
+    # one sided p-value of each metric of the observed per bar returns (e.g. strategy_return, or exposure *
+    # asset returns for the shuffled signal test) against its resampled distribution, higher is better (for
+    # Max Drawdown that means shallower), with the +1 correction so it is never exactly 0. periods_per_year
+    # must be the one the distribution was computed with
+    observed = path_metrics(returns, periods_per_year).iloc[0]
+    rows = {}
+    for name in METRICS:
+        values = distribution[name].dropna().to_numpy()
+        rows[name] = {
+            'observed': observed[name],
+            'mean': values.mean() if len(values) else np.nan,
+            'p05': np.percentile(values, 5) if len(values) else np.nan,
+            'p95': np.percentile(values, 95) if len(values) else np.nan,
+            'p_value': (1 + (values >= observed[name]).sum()) / (1 + len(values)),
+        }
+    return pd.DataFrame(rows).T
+
+def _normal_cdf(values):
+    return np.vectorize(NORMAL.cdf, otypes=[float])(values)
+
+def probabilistic_sharpe(sharpe, n_obs, benchmark=0.0, skew=0.0, kurtosis=3.0):
+    # probability that the true per period Sharpe exceeds benchmark given the observed one over n_obs periods
+    sharpe = np.asarray(sharpe, dtype=np.float64)
+    spread = np.sqrt(1 - skew * sharpe + (kurtosis - 1) / 4 * sharpe ** 2)
+    return _normal_cdf((sharpe - benchmark) * np.sqrt(n_obs - 1) / spread)
+
+def expected_max_sharpe(sharpes):
+    # Sharpe the best of len(sharpes) independent trials reaches by chance, given their dispersion
+    sharpes = np.asarray(sharpes, dtype=np.float64)
+    trials = len(sharpes)
+    if trials < 2:
+        return 0.0
+    return np.std(sharpes, ddof=1) * (
+        (1 - EULER_GAMMA) * NORMAL.inv_cdf(1 - 1 / trials) + EULER_GAMMA * NORMAL.inv_cdf(1 - 1 / (trials * np.e))
+    )
+
+def adjust_pvalues(pvalues, method='holm'):
+    # family wise (holm, bonferroni) or false discovery rate (bh) adjusted p-values, NaN stays NaN
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(len(pvalues), np.nan)
+    valid = np.flatnonzero(~np.isnan(pvalues))
+    m = len(valid)
+    if m == 0:
+        return adjusted
+    if method == 'bonferroni':
+        adjusted[valid] = np.minimum(pvalues[valid] * m, 1)
+        return adjusted
+    order = valid[np.argsort(pvalues[valid], kind='stable')]
+    ranked = pvalues[order]
+    if method == 'holm':
+        values = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    elif method == 'bh':
+        values = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        raise ValueError(f"unknown method {method!r}, use holm, bonferroni or bh")
+    adjusted[order] = np.minimum(values, 1)
+    return adjusted
+
+def deflate_sweep(results, n_obs, periods_per_year=252, skew=0.0, kurtosis=3.0, alpha=0.05):
+    # results: run_sweep output, whose Sharpe is annualised from n_obs daily returns (periods_per_year=252).
+    # Adds the probabilistic Sharpe against 0, its holm/bh adjusted p-values and the deflated Sharpe ratio.
+    results = results.copy()
+    sharpe = results['Sharpe'].to_numpy(dtype=np.float64) / np.sqrt(periods_per_year) # per period
+    valid = ~np.isnan(sharpe)
+    psr = np.full(len(sharpe), np.nan)
+    dsr = np.full(len(sharpe), np.nan)
+    psr[valid] = probabilistic_sharpe(sharpe[valid], n_obs, 0.0, skew, kurtosis)
+    dsr[valid] = probabilistic_sharpe(sharpe[valid], n_obs, expected_max_sharpe(sharpe[valid]), skew, kurtosis)
+    results['PSR'] = psr
+    results['p_value'] = 1 - psr
+    results['p_holm'] = adjust_pvalues(results['p_value'], 'holm')
+    results['p_bh'] = adjust_pvalues(results['p_value'], 'bh')
+    results['DSR'] = dsr
+    results['significant'] = results['p_holm'] < alpha
+    return results
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(1)
+    n_bars, n_paths = 1_000_000, 10_000
+    returns = rng.standard_t(4, n_bars) * 2e-4 + 1e-6
+
+    # the block scan matches metrics computed on the explicit paths
+    check = block_bootstrap_paths(returns[:20_000], 64, block_size=37, seed=3)
+    explicit = pd.concat([path_metrics(paths) for paths in check], ignore_index=True)
+    fast = bootstrap_metrics(returns[:20_000], 64, block_size=37, seed=3)
+    assert np.allclose(explicit.to_numpy(), fast.to_numpy(), rtol=1e-5, equal_nan=True)
+
+    start = time.perf_counter()
+    distribution = bootstrap_metrics(returns, n_paths, center=True)
+    print(f"{n_paths:,} bootstrap paths of {n_bars:,} bars in {time.perf_counter() - start:.2f}s")
+    print(significance(returns, distribution).to_string())
@@ -0,0 +1,202 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Online version of MeanReversionBacktester for live bars: on_bar(close, ts) updates everything in O(1).
+# Rolling mean/std of close (lookback) and of returns (volatility_lookback) are kept in ring buffers with a
+# sliding Welford update, the latency shift is a fixed length queue of raw signals, and sizing, slippage,
+# fee and the cash cumsums follow _generate_signals, _volatility_scaling and _simulate_trades bar by bar.
+
+ANNUALISATION = math.sqrt(252 * 390)
+
+class RollingWindow:
+    __slots__ = ('size', 'buffer', 'pos', 'count', 'mean', 'm2', 'updates', 'resync')
+
+    def __init__(self, size, resync=100_000):
+        self.size = size
+        self.buffer = [0.0] * size
+        self.pos = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+        self.resync = resync # recompute from the buffer every resync updates to stop rounding drift
+
+    def push(self, x):
+        if self.count < self.size:
+            self.buffer[self.pos] = x
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.buffer[self.pos]
+            self.buffer[self.pos] = x
+            new_mean = self.mean + (x - old) / self.size
+            self.m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.mean = new_mean
+            self.updates += 1
+            if self.updates >= self.resync:
+                self._recompute()
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+
+    def _recompute(self):
+        self.updates = 0
+        self.mean = math.fsum(self.buffer) / self.size
+        self.m2 = math.fsum((x - self.mean) ** 2 for x in self.buffer)
+
+    @property
+    def full(self):
+        return self.count == self.size
+
+    @property
+    def std(self):
+        # sample standard deviation like pandas rolling().std()
+        if self.count < 2:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - 1)) if self.m2 > 0 else 0.0
+
+class OnlineMeanReversion:
+    __slots__ = (
+        'lookback', 'entry_z', 'exit_z', 'slippage', 'fee', 'latency', 'volatility_lookback', 'capital', 'max_vol',
+        'prices', 'returns', 'pending', 'prev_close', 'prev_position', 'prev_portfolio', 'traded_value', 'costs',
+        'ts', 'close', 'zscore', 'volatility', 'signal', 'position', 'position_change', 'trade_price',
+        'transaction_cost', 'holdings', 'cash', 'portfolio', 'strategy_return'
+    )
+
+    def __init__(
+        self, lookback=20, entry_z=-1.0, exit_z=0.0, slippage=0.0005, fee=0.0003,
+        latency=1, volatility_lookback=60, capital=1e6, max_vol=0.02
+    ):
+        self.lookback = lookback
+        self.entry_z = entry_z
+        self.exit_z = exit_z
+        self.slippage = slippage
+        self.fee = fee
+        self.latency = latency
+        self.volatility_lookback = volatility_lookback
+        self.capital = capital
+        self.max_vol = max_vol
+        self.prices = RollingWindow(lookback)
+        self.returns = RollingWindow(volatility_lookback)
+        self.pending = deque([0] * latency) # raw signals waiting out the latency
+        self.prev_close = None
+        self.prev_position = None
+        self.prev_portfolio = None
+        self.traded_value = 0.0 # running cumsum of trade_price * position_change
+        self.costs = 0.0 # running cumsum of transaction_cost
+        self.ts = None
+        self.close = math.nan
+        self.zscore = math.nan
+        self.volatility = math.nan
+        self.signal = 0
+        self.position = 0.0
+        self.position_change = 0.0
+        self.trade_price = math.nan
+        self.transaction_cost = 0.0
+        self.holdings = 0.0
+        self.cash = capital
+        self.portfolio = capital
+        self.strategy_return = 0.0
+
+    def on_bar(self, close, ts=None):
+        # returns the target position after this bar, or None while the rolling windows are still warming up
+        self.ts = ts
+        self.close = close
+        self.prices.push(close)
+        if self.prev_close is not None:
+            self.returns.push(close / self.prev_close - 1)
+        self.prev_close = close
+        if not (self.prices.full and self.returns.full):
+            return None
+
+        std = self.prices.std
+        deviation = close - self.prices.mean
+        if std == 0:
+            if deviation == 0:
+                return None # 0 / 0 is NaN, the batch run drops the row
+            zscore = math.copysign(math.inf, deviation)
+        else:
+            zscore = deviation / std
+        volatility = self.returns.std * ANNUALISATION
+        self.zscore = zscore
+        self.volatility = volatility
+
+        raw = 1 if zscore < self.entry_z else 0
+        if zscore > self.exit_z:
+            raw = 0
+        self.pending.append(raw)
+        signal = self.pending.popleft()
+        self.signal = signal
+
+        scaled = min(self.capital * self.max_vol / volatility, self.capital) if volatility > 0 else self.capital
+        position = signal * scaled / close
+        change = 0.0 if self.prev_position is None else position - self.prev_position
+        direction = (change > 0) - (change < 0)
+        trade_price = close * (1 + self.slippage * direction)
+        cost = trade_price * abs(change) * self.fee
+        self.traded_value += trade_price * change
+        self.costs += cost
+        cash = self.capital - (self.traded_value + self.costs)
+        holdings = position * close
+        portfolio = cash + holdings
+
+        self.strategy_return = 0.0 if self.prev_portfolio is None else portfolio / self.prev_portfolio - 1
+        self.position = position
+        self.position_change = change
+        self.trade_price = trade_price
+        self.transaction_cost = cost
+        self.holdings = holdings
+        self.cash = cash
+        self.portfolio = portfolio
+        self.prev_position = position
+        self.prev_portfolio = portfolio
+        return position
+
+def replay(data, **params):
+    # feeds a historical frame bar by bar and returns the same columns the batch run() produces
+    engine = OnlineMeanReversion(**params)
+    rows = []
+    index = []
+    for ts, close in zip(data.index, data['close'].to_numpy()):
+        if engine.on_bar(float(close), ts) is None:
+            continue
+        index.append(ts)
+        rows.append((
+            engine.zscore, engine.volatility, engine.signal, engine.position, engine.position_change,
+            engine.trade_price, engine.transaction_cost, engine.holdings, engine.cash, engine.portfolio,
+            engine.strategy_return
+        ))
+    columns = [
+        'zscore', 'volatility', 'signal', 'position', 'position_change', 'trade_price', 'transaction_cost',
+        'holdings', 'cash', 'portfolio', 'strategy_return'
+    ]
+    return pd.DataFrame(rows, index=pd.Index(index, name=data.index.name), columns=columns)
+
+if __name__ == "__main__":
+    import time
+    from q1 import MeanReversionBacktester
+
+    np.random.seed(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=1560, freq="min")
+    price = (
+        100 + np.linspace(0, 2, len(minutes)) + 2 * np.sin(np.linspace(0, 20 * np.pi, len(minutes)))
+        + np.random.normal(0, 0.2, len(minutes))
+    )
+    data = pd.DataFrame({'close': price}, index=minutes)
+
+    batch = MeanReversionBacktester(data).run()
+    start = time.perf_counter()
+    online = replay(data)
+    elapsed = time.perf_counter() - start
+
+    # replaying the history bar by bar has to reproduce the batch run
+    assert online.index.equals(batch.index)
+    assert (online['signal'] == batch['signal']).all()
+    for column in online.columns:
+        np.testing.assert_allclose(online[column], batch[column], rtol=1e-9, atol=1e-6, err_msg=column)
+    print(f"replay matches batch run on {len(online)} bars, {elapsed / len(data) * 1e6:.1f} us per bar")
@@ -0,0 +1,128 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from q1 import MeanReversionBacktester, add_rolling_features
+
+# Parameter sweep for MeanReversionBacktester.
+# The OHLCV input is written once to shared memory and every worker maps it instead of receiving a pickled copy.
+# Grid points are grouped by (lookback, volatility_lookback) so the rolling statistics are computed once per window
+# in each worker and reused by every entry_z / exit_z / latency / max_vol combination on top of them.
+
+DEFAULTS = {'lookback': 20, 'volatility_lookback': 60}
+
+WORKER = {} # per process state: the mapped frame, its shared memory handles and the rolling statistics cache
+
+def share_frame(data):
+    # numeric columns go into one float64 block, the index into an int64 block of nanoseconds
+    numeric = data.select_dtypes(include=[np.number])
+    values = numeric.to_numpy(dtype=np.float64)
+    stamps = data.index.asi8
+    value_shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    index_shm = shared_memory.SharedMemory(create=True, size=max(stamps.nbytes, 1))
+    np.ndarray(values.shape, dtype=np.float64, buffer=value_shm.buf)[:] = values
+    np.ndarray(stamps.shape, dtype=np.int64, buffer=index_shm.buf)[:] = stamps
+    spec = (value_shm.name, index_shm.name, values.shape, list(numeric.columns), str(data.index.tz) if data.index.tz else None)
+    return spec, [value_shm, index_shm]
+
+def attach_frame(spec):
+    value_name, index_name, shape, columns, tz = spec
+    value_shm = shared_memory.SharedMemory(name=value_name)
+    index_shm = shared_memory.SharedMemory(name=index_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=value_shm.buf)
+    stamps = np.ndarray((shape[0],), dtype=np.int64, buffer=index_shm.buf)
+    index = pd.DatetimeIndex(stamps.view('datetime64[ns]'))
+    if tz is not None:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    frame = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    return frame, [value_shm, index_shm]
+
+def init_worker(spec):
+    frame, handles = attach_frame(spec)
+    WORKER.update(data=frame, handles=handles, cache={})
+
+def prepared_frame(data, lookback, volatility_lookback, cache):
+    # same result as MeanReversionBacktester._prepare_data, with the rolling statistics taken from cache
+    return add_rolling_features(data.copy(deep=False), lookback, volatility_lookback, cache)
+
+def run_combo(prepared, params, fixed):
+    bt = MeanReversionBacktester(prepared, prepared=True, **params, **fixed)
+    bt.run()
+    return bt.evaluate_performance(plot=False, verbose=False)
+
+def _run_task(task):
+    windows, combos, fixed = task
+    data = WORKER['data']
+    prepared = prepared_frame(data, windows[0], windows[1], WORKER['cache'])
+    return [(position, run_combo(prepared, params, fixed)) for position, params in combos]
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def run_sweep(data, grid, n_jobs=None, chunksize=None, **fixed):
+    # grid: dict of MeanReversionBacktester argument -> list of values, fixed: arguments shared by every run
+    combos = expand_grid(grid)
+    groups = {}
+    for position, params in enumerate(combos):
+        windows = (
+            params.get('lookback', fixed.get('lookback', DEFAULTS['lookback'])),
+            params.get('volatility_lookback', fixed.get('volatility_lookback', DEFAULTS['volatility_lookback']))
+        )
+        run_params = dict(params, lookback=windows[0], volatility_lookback=windows[1])
+        groups.setdefault(windows, []).append((position, run_params))
+    fixed = {k: v for k, v in fixed.items() if k not in DEFAULTS}
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(combos) // (n_jobs * 4))
+    tasks = [
+        (windows, members[i:i + chunksize], fixed)
+        for windows, members in groups.items()
+        for i in range(0, len(members), chunksize)
+    ]
+
+    results = []
+    if n_jobs == 1:
+        WORKER.update(data=data, cache={})
+        try:
+            for task in tasks:
+                results.extend(_run_task(task))
+        finally:
+            WORKER.clear()
+    else:
+        spec, handles = share_frame(data)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(spec,)) as pool:
+                for chunk in pool.map(_run_task, tasks):
+                    results.extend(chunk)
+        finally:
+            for shm in handles:
+                shm.close()
+                shm.unlink()
+
+    results.sort(key=lambda item: item[0])
+    rows = [dict(combos[position], **metrics) for position, metrics in results]
+    return pd.DataFrame(rows, columns=list(grid) + ['Sharpe', 'Max Drawdown', 'CAGR', 'Turnover', 'Hit Rate'])
+
+if __name__ == "__main__":
+    np.random.seed(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=1560 * 5, freq="min")
+    price = (
+        100 + np.linspace(0, 2, len(minutes)) + 2 * np.sin(np.linspace(0, 100 * np.pi, len(minutes)))
+        + np.random.normal(0, 0.2, len(minutes))
+    )
+    data = pd.DataFrame({'close': price, 'volume': np.random.randint(100, 1000, size=len(minutes))}, index=minutes)
+    grid = {
+        'lookback': [10, 20, 40],
+        'entry_z': [-1.5, -1.0, -0.5],
+        'exit_z': [0.0, 0.5],
+        'latency': [0, 1, 2],
+        'max_vol': [0.01, 0.02],
+    }
+    results = run_sweep(data, grid)
+    print(results.sort_values('Sharpe', ascending=False).head(10).to_string(index=False))
@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from q1 import MeanReversionBacktester, performance_metrics
+from sweep import DEFAULTS, WORKER, expand_grid, init_worker, prepared_frame, share_frame
+
+# Walk-forward evaluation of MeanReversionBacktester: optimise the grid on fold k's train window,
+# trade the best parameters on the following test window, then slide.
+# The rolling z-score and volatility inputs only ever look back, so they are computed once per window
+# over the whole history and every fold slices the bars it needs; advancing a fold only adds the new bars
+# instead of re-running _prepare_data over the overlapping history. Once the statistics are shared the
+# folds are independent and run concurrently over the same shared memory frame as the sweep.
+
+def make_folds(n, train_size, test_size, step=None, expanding=False):
+    # positional (train_start, train_end, test_start, test_end) with half open ranges
+    step = step or test_size
+    if step < test_size:
+        raise ValueError("step must be at least test_size so the out-of-sample windows do not overlap")
+    folds = []
+    start = 0
+    while start + train_size + test_size <= n:
+        train_start = 0 if expanding else start
+        train_end = start + train_size
+        folds.append((train_start, train_end, train_end, train_end + test_size))
+        start += step
+    return folds
+
+def _prepared(windows):
+    key = ('prepared',) + windows
+    cache = WORKER['cache']
+    if key not in cache:
+        cache[key] = prepared_frame(WORKER['data'], windows[0], windows[1], cache)
+    return cache[key]
+
+def _slice(prepared, index, start, end):
+    # fold bounds are positions in the raw input, the prepared frame has the warm-up rows dropped
+    lo = prepared.index.searchsorted(index[start], side='left')
+    hi = prepared.index.searchsorted(index[end - 1], side='right')
+    return prepared.iloc[lo:hi]
+
+def _backtest(frame, params, fixed):
+    bt = MeanReversionBacktester(frame, prepared=True, **params, **fixed)
+    bt.run()
+    return bt
+
+def _run_fold(task):
+    number, (train_start, train_end, test_start, test_end), combos, objective, fixed = task
+    index = WORKER['data'].index
+    best, best_score, best_rank = None, np.nan, -np.inf
+    for params in combos:
+        train = _slice(_prepared((params['lookback'], params['volatility_lookback'])), index, train_start, train_end)
+        if len(train) < 2:
+            continue
+        score = _backtest(train, params, fixed).evaluate_performance(plot=False, verbose=False)[objective]
+        rank = -np.inf if np.isnan(score) else score # a NaN objective never beats a valid one
+        if best is None or rank > best_rank:
+            best, best_score, best_rank = params, score, rank
+    if best is None:
+        return number, None, None, None
+
+    test = _slice(_prepared((best['lookback'], best['volatility_lookback'])), index, test_start, test_end)
+    if len(test) < 2:
+        return number, best, best_score, None
+    bt = _backtest(test, best, fixed)
+    return number, best, best_score, bt.data[['strategy_return', 'position', 'position_change', 'portfolio']]
+
+def walk_forward(data, grid, train_size, test_size, step=None, expanding=False, objective='Sharpe', n_jobs=None, **fixed):
+    # sizes are in bars of data; returns a dict with per-fold results, the stitched out-of-sample
+    # returns/equity curve and the metrics of the stitched curve
+    folds = make_folds(len(data), train_size, test_size, step, expanding)
+    combos = []
+    for params in expand_grid(grid):
+        params.setdefault('lookback', fixed.get('lookback', DEFAULTS['lookback']))
+        params.setdefault('volatility_lookback', fixed.get('volatility_lookback', DEFAULTS['volatility_lookback']))
+        combos.append(params)
+    fixed = {k: v for k, v in fixed.items() if k not in DEFAULTS}
+    tasks = [(number, fold, combos, objective, fixed) for number, fold in enumerate(folds)]
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    if n_jobs == 1:
+        WORKER.update(data=data, cache={})
+        try:
+            outcomes = [_run_fold(task) for task in tasks]
+        finally:
+            WORKER.clear()
+    else:
+        spec, handles = share_frame(data)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(spec,)) as pool:
+                outcomes = list(pool.map(_run_fold, tasks))
+        finally:
+            for shm in handles:
+                shm.close()
+                shm.unlink()
+
+    rows = []
+    pieces = []
+    for number, best, score, frame in sorted(outcomes, key=lambda item: item[0]):
+        train_start, train_end, test_start, test_end = folds[number]
+        row = {
+            'fold': number,
+            'train_start': data.index[train_start],
+            'train_end': data.index[train_end - 1],
+            'test_start': data.index[test_start],
+            'test_end': data.index[test_end - 1],
+            f'train_{objective}': score,
+        }
+        row.update({name: (best or {}).get(name) for name in grid})
+        if frame is not None:
+            row.update(performance_metrics(frame['strategy_return'], frame['position'], frame['position_change']))
+            pieces.append(frame)
+        rows.append(row)
+
+    folds_table = pd.DataFrame(rows)
+    if not pieces:
+        return {'folds': folds_table, 'returns': pd.Series(dtype=float), 'equity': pd.Series(dtype=float), 'metrics': {}}
+    # every fold starts flat with fresh capital, so folds are chained through their returns
+    oos = pd.concat(pieces)
+    capital = fixed.get('capital', 1e6)
+    equity = capital * (1 + oos['strategy_return']).cumprod()
+    return {
+        'folds': folds_table,
+        'returns': oos['strategy_return'],
+        'equity': equity,
+        'metrics': performance_metrics(oos['strategy_return'], oos['position'], oos['position_change']),
+    }
+
+if __name__ == "__main__":
+    np.random.seed(123)
+    minutes = pd.date_range("2025-01-01 09:30", periods=390 * 20, freq="min")
+    price = (
+        100 + np.linspace(0, 2, len(minutes)) + 2 * np.sin(np.linspace(0, 150 * np.pi, len(minutes)))
+        + np.random.normal(0, 0.2, len(minutes))
+    )
+    data = pd.DataFrame({'close': price}, index=minutes)
+    grid = {'lookback': [10, 20, 40], 'entry_z': [-1.5, -1.0], 'latency': [1], 'max_vol': [0.02]}
+    result = walk_forward(data, grid, train_size=390 * 3, test_size=390)
+    print(result['folds'].to_string(index=False))
+    print(result['metrics'])
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from tick_aggregator import StreamingTickAggregator, aggregate_ticks, to_frame
+
+# Python counterpart of benchmark.cpp: aggregate_ticks and the streaming variant against
+# df.resample().agg() on the same synthetic ticks. resample runs with origin='epoch' so its bins line up
+# with the TickAggregator buckets, the empty bins it emits are dropped before the results are compared.
+
+def synthetic_ticks(n, seed=42):
+    rng = np.random.default_rng(seed)
+    timestamps = 1672531200000000000 + np.cumsum(rng.integers(1_000_000, 20_000_000, n)) # 1-20ms apart
+    prices = 100 + np.cumsum(rng.normal(0, 0.01, n))
+    volumes = rng.integers(1, 100, n)
+    return timestamps, prices, volumes
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_resample(timestamps, prices, volumes, bar_seconds):
+    ticks = pd.DataFrame({'price': prices, 'volume': volumes}, index=pd.DatetimeIndex(timestamps.view('datetime64[ns]')))
+    bars = ticks.resample(f'{bar_seconds}s', origin='epoch').agg(
+        {'price': ['first', 'max', 'min', 'last'], 'volume': 'sum'}
+    )
+    bars.columns = ['open', 'high', 'low', 'close', 'volume']
+    return bars.dropna()
+
+def run_streaming(timestamps, prices, volumes, bar_seconds, chunk):
+    aggregator = StreamingTickAggregator(bar_seconds)
+    parts = [
+        aggregator.update(timestamps[i:i + chunk], prices[i:i + chunk], volumes[i:i + chunk])
+        for i in range(0, len(timestamps), chunk)
+    ]
+    parts.append(aggregator.flush())
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=10_000_000)
+    parser.add_argument('--bar-seconds', type=int, default=60)
+    parser.add_argument('--chunk', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    timestamps, prices, volumes = synthetic_ticks(args.ticks)
+    candles, numpy_seconds = timed(aggregate_ticks, timestamps, prices, volumes, args.bar_seconds)
+    streamed, streaming_seconds = timed(run_streaming, timestamps, prices, volumes, args.bar_seconds, args.chunk)
+    resampled, pandas_seconds = timed(run_resample, timestamps, prices, volumes, args.bar_seconds)
+
+    bars = to_frame(candles)
+    assert bars.index.equals(resampled.index)
+    assert np.array_equal(bars.to_numpy(), resampled.to_numpy())
+    assert all(np.array_equal(candles[name], streamed[name]) for name in candles)
+
+    print(f"{args.ticks:,} ticks -> {len(bars):,} bars of {args.bar_seconds}s")
+    print(f"aggregate_ticks           {numpy_seconds:8.3f}s  {args.ticks / numpy_seconds / 1e6:8.1f}M ticks/s")
+    print(f"StreamingTickAggregator   {streaming_seconds:8.3f}s  {args.ticks / streaming_seconds / 1e6:8.1f}M ticks/s")
+    print(f"resample().agg()          {pandas_seconds:8.3f}s  {args.ticks / pandas_seconds / 1e6:8.1f}M ticks/s")
+    print(f"speedup vs pandas         {pandas_seconds / numpy_seconds:8.1f}x")
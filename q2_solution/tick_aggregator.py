@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+# NumPy port of TickAggregator.h.
+# Same bucketing: a tick belongs to bucket timestamp_ns / bar_duration_ns and a new candle is opened when a tick
+# reaches open_time + bar_duration of the current one. Only one candle is open at a time, so a tick that is
+# older than the open candle is folded into it, exactly like update_candle in the C++ version.
+# That rule means the open candle's bucket is the running maximum of the buckets seen so far: candles start
+# where the running maximum increases, and OHLCV are segmented reductions (reduceat) between those starts.
+
+NS_PER_SECOND = 1_000_000_000
+
+CANDLE_FIELDS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+
+def _empty():
+    return {
+        'open_time': np.empty(0, dtype=np.int64),
+        'open': np.empty(0), 'high': np.empty(0), 'low': np.empty(0), 'close': np.empty(0),
+        'volume': np.empty(0, dtype=np.int64),
+    }
+
+def _reduce(bucket, prices, volumes, starts, duration):
+    ends = np.r_[starts[1:], len(prices)]
+    return {
+        'open_time': bucket[starts] * duration,
+        'open': prices[starts],
+        'high': np.maximum.reduceat(prices, starts),
+        'low': np.minimum.reduceat(prices, starts),
+        'close': prices[ends - 1],
+        'volume': np.add.reduceat(volumes, starts),
+    }
+
+def aggregate_ticks(timestamps, prices, volumes, bar_duration_seconds):
+    # timestamps in Unix nanoseconds, returns a dict of candle arrays (open_time in nanoseconds)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    volumes = np.asarray(volumes, dtype=np.int64)
+    if len(timestamps) == 0:
+        return _empty()
+    duration = int(bar_duration_seconds) * NS_PER_SECOND
+    bucket = np.maximum.accumulate(timestamps // duration)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] > bucket[:-1]])
+    return _reduce(bucket, prices, volumes, starts, duration)
+
+class StreamingTickAggregator:
+    # Feeds ticks chunk by chunk and carries the open candle across chunks, update() returns the candles
+    # that were closed by the chunk and flush() the last open one.
+
+    def __init__(self, bar_duration_seconds):
+        self.duration = int(bar_duration_seconds) * NS_PER_SECOND
+        self.current = None # (bucket, open, high, low, close, volume) of the open candle
+
+    def update(self, timestamps, prices, volumes):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.int64)
+        if len(timestamps) == 0:
+            return _empty()
+
+        raw = timestamps // self.duration
+        if self.current is None:
+            bucket = np.maximum.accumulate(raw)
+            starts = np.flatnonzero(np.r_[True, bucket[1:] > bucket[:-1]])
+            head = 0
+        else:
+            bucket = np.maximum.accumulate(np.maximum(raw, self.current[0]))
+            starts = np.flatnonzero(np.r_[bucket[0] > self.current[0], bucket[1:] > bucket[:-1]])
+            head = starts[0] if len(starts) else len(prices) # ticks before head still belong to the open candle
+            if head > 0:
+                b, o, h, l, c, v = self.current
+                self.current = (
+                    b, o, max(h, prices[:head].max()), min(l, prices[:head].min()), prices[head - 1],
+                    v + int(volumes[:head].sum())
+                )
+
+        if len(starts) == 0:
+            return _empty()
+        candles = _reduce(bucket, prices, volumes, starts, self.duration)
+        if self.current is not None:
+            # the carried candle was closed by the tick at head
+            for name, value in zip(CANDLE_FIELDS, (self.current[0] * self.duration,) + self.current[1:]):
+                candles[name] = np.r_[value, candles[name]].astype(candles[name].dtype)
+        # the last candle stays open
+        self.current = (
+            int(bucket[-1]), float(candles['open'][-1]), float(candles['high'][-1]), float(candles['low'][-1]),
+            float(candles['close'][-1]), int(candles['volume'][-1])
+        )
+        return {name: values[:-1] for name, values in candles.items()}
+
+    def flush(self):
+        if self.current is None:
+            return _empty()
+        b, o, h, l, c, v = self.current
+        self.current = None
+        return {
+            'open_time': np.array([b * self.duration], dtype=np.int64),
+            'open': np.array([o]), 'high': np.array([h]), 'low': np.array([l]), 'close': np.array([c]),
+            'volume': np.array([v], dtype=np.int64),
+        }
+
+def read_ticks(path_or_buffer):
+    # same line format as TickAggregator::parse_line: timestamp (Unix nano),price,volume
+    ticks = pd.read_csv(
+        path_or_buffer, header=None, names=['timestamp', 'price', 'volume'],
+        dtype={'timestamp': np.int64, 'price': np.float64, 'volume': np.int64}
+    )
+    return ticks['timestamp'].to_numpy(), ticks['price'].to_numpy(), ticks['volume'].to_numpy()
+
+def to_frame(candles):
+    # OHLCV frame indexed by open time, the column layout MeanReversionBacktester expects
+    index = pd.DatetimeIndex(candles['open_time'].view('datetime64[ns]'), name='open_time')
+    return pd.DataFrame({name: candles[name] for name in CANDLE_FIELDS[1:]}, index=index)
+
+if __name__ == "__main__":
+    import io
+
+    # the ticks of BasicAggregation in test.cpp. Buckets are aligned to the epoch like initialize_first_candle
+    # does, so with 13 second bars the first candle opens at 23:59:58 and the tick at 00:00:12 already starts
+    # the second one (test.cpp expects candles aligned to the first tick, which the header does not do).
+    csv_data = (
+        "1672531200000000000,100.0,10\n"
+        "1672531201000000000,102.5,5\n"
+        "1672531212000000000,99.0,8\n"
+        "1672531213000000000,105.0,12\n"
+        "1672531215000000000,106.0,20\n"
+    )
+    candles = to_frame(aggregate_ticks(*read_ticks(io.StringIO(csv_data)), 13))
+    print(candles)
+    assert len(candles) == 2
+    assert candles.index[0].value == 1672531200000000000 // (13 * NS_PER_SECOND) * (13 * NS_PER_SECOND)
+    assert candles.iloc[0].tolist() == [100.0, 102.5, 100.0, 102.5, 15]
+    assert candles.iloc[1].tolist() == [99.0, 106.0, 99.0, 106.0, 40]
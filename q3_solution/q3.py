@@ -1,32 +1,13 @@
+import os
+from contextlib import nullcontext
+
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import f1_score, roc_auc_score
-
-df = pd.read_csv('ethusdt_ticks.csv', parse_dates=['timestamp'])
-df.set_index('timestamp', inplace=True)
-
-
-
-df['mid_price'] = (df['bid_price'] + df['ask_price']) / 2
-
-
-df['obi'] = (df['bid_size'] - df['ask_size']) / (df['bid_size'] + df['ask_size'] + 1e-9)
-df['buy_volume'] = np.where(df['side'] == 'buy', df['trade_size'], 0)
-df['sell_volume'] = np.where(df['side'] == 'sell', df['trade_size'], 0)
-df['tfi'] = (df['buy_volume'] - df['sell_volume']).rolling('10s').sum()
-
-
-df['log_return'] = np.log(df['mid_price'] / df['mid_price'].shift(1))
-df['volatility'] = df['log_return'].rolling('1min').std()
-
 
-df['spread'] = df['ask_price'] - df['bid_price']
-df['signed_volume'] = np.where(df['side'] == 'buy', df['trade_size'], -df['trade_size'])
-df['price_impact'] = df['signed_volume'] * df['spread']
-df['trade_count'] = 1
-df['intensity'] = df['trade_count'].rolling('10s').sum()
+TICKS_PATH = 'ethusdt_ticks.csv'
+FLOW_WINDOW = '10s' # window of the tfi and intensity rolling sums
+VOL_WINDOW = '1min' # window of the rolling volatility
+BAR = '1min'
 
 agg = {
     'obi': 'last',
@@ -37,30 +18,219 @@ agg = {
     'intensity': 'mean',
     'mid_price': 'last'
 }
-features = df.resample('1min').agg(agg)
-
-
-features['future_price'] = features['mid_price'].shift(-1)
-features['return'] = (features['future_price'] - features['mid_price']) / features['mid_price']
-features['label'] = np.where(features['return'] > 0, 1, 0)
-
-features = features.dropna()
-
-
-X = features.drop(columns=['future_price', 'return', 'label', 'mid_price'])
-y = features['label']
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, shuffle=False, test_size=0.9)
-
-model = RandomForestClassifier(n_estimators=100, max_depth=5)
-model.fit(X_train, y_train)
-
-y_pred = model.predict(X_test)
-y_proba = model.predict_proba(X_test)[:, 1]
-
-
-f1 = f1_score(y_test, y_pred)
-auc = roc_auc_score(y_test, y_proba)
 
-print(f"F1 Score: {f1:.4f}")
-print(f"AUC-ROC: {auc:.4f}")
+def load_ticks(path=TICKS_PATH):
+    if os.path.isdir(path): # binary store written by tick_store.convert_csv
+        from tick_store import TickStore
+        return TickStore(path).to_frame()
+    df = pd.read_csv(path, parse_dates=['timestamp'])
+    df.set_index('timestamp', inplace=True)
+    return df
+
+def read_tick_chunks(path=TICKS_PATH, chunksize=1_000_000):
+    if os.path.isdir(path):
+        from tick_store import TickStore
+        yield from TickStore(path).iter_frames(chunksize)
+        return
+    for chunk in pd.read_csv(path, parse_dates=['timestamp'], chunksize=chunksize):
+        chunk.set_index('timestamp', inplace=True)
+        yield chunk
+
+def _rolling_sums(stamps, window, *columns, spilled=None):
+    # for every tick's (t - window, t] window, the bounds of pandas' time based rolling: the position of its first
+    # tick, and per column the sum and the count of its non NaN values. Instead of pandas' running sums, which
+    # carry rounding from the first tick on, the sums restart at every epoch aligned segment one window long: a
+    # window spans at most two segments and its sum only depends on their ticks, so stream_features, which carries
+    # whole segments, gets the same bits whatever its chunk size.
+    # spilled optionally gives, per column, the values summed for the ticks of a window that lie in the previous
+    # segment (columns by default), add_tick_features uses it to shift them by the next segment's reference
+    n = len(stamps)
+    starts = np.searchsorted(stamps, stamps - window, side='right')
+    segment = stamps // window
+    new_segment = np.empty(n, dtype=bool)
+    new_segment[:1] = True
+    np.not_equal(segment[1:], segment[:-1], out=new_segment[1:])
+    segment_start = np.maximum.accumulate(np.where(new_segment, np.arange(n), 0)) # first tick of the segment
+    spills = starts < segment_start # the window starts in the previous segment
+    inside = ~np.take(new_segment, np.minimum(starts, n - 1)) # the tick before the window is in its first segment
+    valid = [~np.isnan(np.asarray(column, dtype=np.float64)) for column in columns]
+    spilled = columns if spilled is None else spilled
+    local = pd.DataFrame({
+        position: np.where(mask, column, 0.0)
+        for position, (column, mask) in enumerate(zip(list(columns) + list(spilled), valid + valid))
+    }).groupby(np.cumsum(new_segment)).cumsum()
+    sums, counts = [], []
+    for position, mask in enumerate(valid):
+        running = np.zeros(n + 1) # running[i + 1]: sum of tick i's segment up to tick i
+        running[1:] = local[position].to_numpy()
+        previous = running
+        if spilled is not columns:
+            previous = np.zeros(n + 1) # the same with the spilled values
+            previous[1:] = local[len(columns) + position].to_numpy()
+        total = running[1:] - np.where(inside & ~spills, np.take(running, starts), 0.0)
+        total += np.where(spills, np.take(previous, segment_start) - np.where(inside, np.take(previous, starts), 0.0), 0.0)
+        sums.append(total)
+        count = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(mask, out=count[1:])
+        counts.append(count[1:] - np.take(count, starts))
+    return starts, sums, counts
+
+def add_tick_features(df, segmented=False):
+    # segmented=False is pandas' rolling over the FLOW_WINDOW / VOL_WINDOW before every tick. segmented=True,
+    # which stream_features uses, computes the same windows with the restartable sums of _rolling_sums: the
+    # value of a tick then only depends on the ticks of its segment and the one before, not on where the frame
+    # starts, and agrees with pandas to rounding (tfi within ~1e-14, volatility within ~1e-11 relative, intensity
+    # is equal)
+    if not df.index.is_monotonic_increasing:
+        raise ValueError("ticks must be sorted by timestamp")
+    df['mid_price'] = (df['bid_price'] + df['ask_price']) / 2
+
+
+    df['obi'] = (df['bid_size'] - df['ask_size']) / (df['bid_size'] + df['ask_size'] + 1e-9)
+    df['buy_volume'] = np.where(df['side'] == 'buy', df['trade_size'], 0)
+    df['sell_volume'] = np.where(df['side'] == 'sell', df['trade_size'], 0)
+    if segmented:
+        stamps = df.index.asi8
+        flow_starts, flow, flow_count = _rolling_sums(
+            stamps, pd.Timedelta(FLOW_WINDOW).value, df['buy_volume'] - df['sell_volume']
+        )
+        df['tfi'] = np.where(flow_count[0] > 0, flow[0], np.nan)
+    else:
+        df['tfi'] = (df['buy_volume'] - df['sell_volume']).rolling(FLOW_WINDOW).sum()
+
+
+    df['log_return'] = np.log(df['mid_price'] / df['mid_price'].shift(1))
+    if segmented:
+        df['volatility'] = _segmented_std(stamps, pd.Timedelta(VOL_WINDOW).value, df['log_return'].to_numpy())
+    else:
+        df['volatility'] = df['log_return'].rolling(VOL_WINDOW).std()
+
+
+    df['spread'] = df['ask_price'] - df['bid_price']
+    df['signed_volume'] = np.where(df['side'] == 'buy', df['trade_size'], -df['trade_size'])
+    df['price_impact'] = df['signed_volume'] * df['spread']
+    df['trade_count'] = 1
+    if segmented:
+        df['intensity'] = (np.arange(1, len(df) + 1) - flow_starts).astype(np.float64) # ticks in the window
+    else:
+        df['intensity'] = df['trade_count'].rolling(FLOW_WINDOW).sum()
+    return df
+
+def _segmented_std(stamps, window, returns):
+    # sample std (ddof=1) of the (t - window, t] windows with _rolling_sums. The returns are shifted before
+    # squaring so the sum of squares does not cancel: every tick by the return of the first tick of its segment,
+    # and, for the windows that spill into it from the next segment, by that segment's reference instead,
+    # so both parts of a window share one reference that lies inside the window
+    returns = np.asarray(returns, dtype=np.float64)
+    new_segment = np.empty(len(returns), dtype=bool)
+    segment = stamps // window
+    new_segment[:1] = True
+    np.not_equal(segment[1:], segment[:-1], out=new_segment[1:])
+    references = np.nan_to_num(returns[new_segment]) # one per segment, the first return is NaN
+    number = np.cumsum(new_segment) - 1
+    own = returns - references[number]
+    following = returns - references[np.minimum(number + 1, len(references) - 1)]
+    _, (total, square), (count, _) = _rolling_sums(
+        stamps, window, own, own * own, spilled=(following, following * following)
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (square - total * total / count) / (count - 1)
+    return np.where(count > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+def resample_features(df):
+    return df.resample(BAR).agg(agg)
+
+def stream_features(chunks):
+    # Builds the BAR feature rows from an iterable of tick frames without ever holding all ticks.
+    # Each step keeps the ticks of the last unfinished bar plus, for each rolling window, the whole window
+    # long segments (see _rolling_sums) its windows reach back into, and one more tick for the log return
+    # shift. The features are computed with add_tick_features(segmented=True), so every emitted tick sees the
+    # same ticks summed in the same order whatever the chunk size: streamed builds are bit-identical to each
+    # other and agree with the in-memory pandas path of build_features(path) to rounding (~1e-14).
+    # Only complete bars are emitted, memory is one chunk plus that carried tail.
+    windows = [pd.Timedelta(FLOW_WINDOW).value, pd.Timedelta(VOL_WINDOW).value]
+    carry = None
+    emitted_until = None # ticks before this timestamp have already been turned into bars
+    pieces = []
+
+    def emit(ticks, end):
+        features = add_tick_features(ticks.copy(), segmented=True)
+        start = 0 if emitted_until is None else features.index.searchsorted(emitted_until, side='left')
+        stop = len(features) if end is None else features.index.searchsorted(end, side='left')
+        if stop > start:
+            pieces.append(resample_features(features.iloc[start:stop]))
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        ticks = chunk if carry is None else pd.concat([carry, chunk])
+        boundary = ticks.index[-1].floor(BAR) # bars before this one are complete
+        emit(ticks, boundary)
+        emitted_until = boundary
+        reach = min((boundary.value - window) // window * window for window in windows) # oldest segment start
+        first_needed = np.searchsorted(ticks.index.asi8, reach, side='left')
+        carry = ticks.iloc[max(first_needed - 1, 0):]
+    if carry is not None:
+        emit(carry, None)
+
+    if not pieces:
+        return pd.DataFrame(columns=list(agg))
+    features = pd.concat(pieces)
+    return features.asfreq(BAR) # bars without ticks that fell between two chunks
+
+def stage(instrument, name, frame=None):
+    # instrument is an optional q1_solution/instrumentation.Instrument, None costs nothing
+    return nullcontext() if instrument is None else instrument.stage(name, frame)
+
+def add_labels(features):
+    features['future_price'] = features['mid_price'].shift(-1)
+    features['return'] = (features['future_price'] - features['mid_price']) / features['mid_price']
+    features['label'] = np.where(features['return'] > 0, 1, 0)
+
+    features = features.dropna()
+    return features
+
+def build_features(path=TICKS_PATH, chunksize=None, instrument=None):
+    # chunksize=None loads the whole file, otherwise ticks are streamed chunksize rows at a time (see stream_features
+    # for how the two builds compare)
+    if chunksize is None:
+        with stage(instrument, 'q3.load_ticks'):
+            ticks = load_ticks(path)
+        with stage(instrument, 'q3.add_tick_features', ticks):
+            add_tick_features(ticks)
+        with stage(instrument, 'q3.resample_features', ticks):
+            features = resample_features(ticks)
+    else:
+        with stage(instrument, 'q3.stream_features'):
+            features = stream_features(read_tick_chunks(path, chunksize))
+    with stage(instrument, 'q3.add_labels', features):
+        return add_labels(features)
+
+def train_and_evaluate(features, instrument=None):
+    from sklearn.model_selection import train_test_split
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import f1_score, roc_auc_score
+
+    X = features.drop(columns=['future_price', 'return', 'label', 'mid_price'])
+    y = features['label']
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, shuffle=False, test_size=0.9)
+
+    model = RandomForestClassifier(n_estimators=100, max_depth=5)
+    with stage(instrument, 'q3.fit', X_train):
+        model.fit(X_train, y_train)
+
+    y_pred = model.predict(X_test)
+    y_proba = model.predict_proba(X_test)[:, 1]
+
+
+    f1 = f1_score(y_test, y_pred)
+    auc = roc_auc_score(y_test, y_proba)
+
+    print(f"F1 Score: {f1:.4f}")
+    print(f"AUC-ROC: {auc:.4f}")
+    return f1, auc
+
+if __name__ == "__main__":
+    features = build_features()
+    train_and_evaluate(features)
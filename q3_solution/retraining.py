@@ -0,0 +1,244 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import q3
+import tick_store
+from q3 import TICKS_PATH, build_features, stage
+
+# Walk-forward retraining of the q3 classifier instead of one 10/90 split.
+#
+# Feature cache: the BAR feature matrix (with labels) is pickled under CACHE_DIR, keyed by a hash of the tick
+# input (every byte of the CSV, or every file of a tick_store folder) and of the feature config (windows,
+# aggregation and the source of q3.py and tick_store.py, everything the feature path runs), so editing either
+# rebuilds it and nothing else does.
+#
+# Folds are positional (train_start, train_end, test_start, test_end) over the feature rows, expanding or
+# rolling, with back to back test windows whose predictions are stitched into one out-of-sample series.
+# With warm_start the folds are split into n_chains contiguous chains (1 by default: one model carried through
+# every fold). Inside a chain a model is trained once and then carried forward: the forest keeps its trees and
+# grows trees_per_fold new ones on each new train window (the oldest are dropped beyond max_trees), the
+# incremental learner (SGD on standardised features) only sees the rows added since the previous fold. Its
+# standardiser is fitted on the chain's first train window and then frozen, the carried coefficients were
+# learned on that scaling. Chains, or single folds without warm_start, run in a process pool of n_jobs workers
+# that receives the feature matrix once per worker. n_jobs only schedules them, the results depend on n_chains
+# and never on the machine.
+
+CACHE_DIR = 'feature_cache'
+NON_FEATURES = ['future_price', 'return', 'label', 'mid_price']
+LEARNERS = ('forest', 'sgd')
+
+WORKER = {} # per process state: X and y of the feature matrix
+
+def _hash_input(path, digest):
+    files = [path]
+    if os.path.isdir(path): # tick_store folder
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    for name in files:
+        digest.update(os.path.basename(name).encode())
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 22), b''):
+                digest.update(block)
+
+def feature_config(streamed=False):
+    # everything besides the ticks that decides the feature matrix, streamed builds (build_features with a
+    # chunksize) differ from the in-memory one in the last bits and get their own entry
+    return {
+        'streamed': streamed,
+        'flow_window': q3.FLOW_WINDOW,
+        'vol_window': q3.VOL_WINDOW,
+        'bar': q3.BAR,
+        'agg': q3.agg,
+        'code': [inspect.getsource(module) for module in (q3, tick_store)], # helpers and readers included
+    }
+
+def cache_key(path=TICKS_PATH, config=None):
+    digest = hashlib.blake2b(digest_size=16)
+    _hash_input(path, digest)
+    digest.update(json.dumps(config or feature_config(), sort_keys=True).encode())
+    return digest.hexdigest()
+
+def cached_features(path=TICKS_PATH, cache_dir=CACHE_DIR, chunksize=None, instrument=None):
+    # build_features(path) read from cache_dir when the ticks and the feature config are unchanged.
+    # chunksize=None reads and builds the in-memory entry, any chunksize the streamed one (bit-identical whatever
+    # the chunk size)
+    with stage(instrument, 'q3.cache_key'):
+        key = cache_key(path, feature_config(streamed=chunksize is not None))
+    cached = os.path.join(cache_dir, f"features_{key}.pkl")
+    if os.path.exists(cached):
+        with stage(instrument, 'q3.load_cached_features'):
+            return pd.read_pickle(cached)
+    features = build_features(path, chunksize, instrument)
+    os.makedirs(cache_dir, exist_ok=True)
+    partial = f"{cached}.{os.getpid()}.tmp"
+    features.to_pickle(partial)
+    os.replace(partial, cached) # readers never see a half written file
+    return features
+
+def make_folds(n, n_folds=10, min_train=None, train_size=None):
+    # positional (train_start, train_end, test_start, test_end) with half open ranges: the rows after
+    # min_train are cut into n_folds test windows, train_size=None trains on everything before each
+    # window (expanding), otherwise on the train_size rows before it (rolling)
+    min_train = min_train or train_size or max(n // 10, 1)
+    if min_train >= n:
+        raise ValueError(f"min_train={min_train} leaves no rows to test on out of {n}")
+    edges = np.linspace(min_train, n, min(n_folds, n - min_train) + 1).astype(int).tolist()
+    return [
+        (0 if train_size is None else max(start - train_size, 0), start, start, end)
+        for start, end in zip(edges[:-1], edges[1:])
+    ]
+
+def init_worker(X, y):
+    WORKER.update(X=X, y=y)
+
+def _new_model(learner, params):
+    if learner == 'forest':
+        from sklearn.ensemble import RandomForestClassifier
+        # one RandomState carried through the chain: a warm fit skips one seed per tree it holds before drawing
+        # the new trees' seeds, so with an int seed dropping old trees (max_trees) would hand out used seeds again
+        return RandomForestClassifier(
+            n_estimators=params['trees'], max_depth=params['max_depth'], warm_start=True,
+            random_state=np.random.RandomState(params['seed']),
+        )
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.preprocessing import StandardScaler
+    return StandardScaler(), SGDClassifier(loss='log_loss', alpha=params['alpha'], random_state=params['seed'])
+
+def _fit_forest(model, X, y, params, fresh):
+    if not fresh:
+        model.n_estimators += params['trees_per_fold']
+    model.fit(X, y)
+    max_trees = params['max_trees']
+    if max_trees and len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:] # the oldest trees saw the oldest windows
+        model.n_estimators = max_trees
+
+def _fit_sgd(model, X, y, params, fresh):
+    scaler, sgd = model
+    if fresh:
+        sgd.fit(scaler.fit_transform(X), y)
+    else: # the scaler stays as the first fit left it
+        sgd.partial_fit(scaler.transform(X), y)
+
+def _run_chain(task):
+    # folds of one chain in order, returns (fold number, fit seconds, train rows fitted, probabilities) per fold
+    folds, learner, warm_start, params = task
+    X, y = WORKER['X'], WORKER['y']
+    fit = _fit_forest if learner == 'forest' else _fit_sgd
+    model = None
+    fitted_until = None
+    outcomes = []
+    for number, (train_start, train_end, test_start, test_end) in folds:
+        fresh = model is None or not warm_start
+        if fresh:
+            model = _new_model(learner, params)
+            rows = slice(train_start, train_end)
+        elif learner == 'sgd':
+            rows = slice(max(fitted_until, train_start), train_end) # only the rows added since the last fold
+        else:
+            rows = slice(train_start, train_end) # new trees learn the current window
+        start = time.perf_counter()
+        if rows.stop > rows.start:
+            fit(model, X[rows], y[rows], params, fresh)
+        seconds = time.perf_counter() - start
+        fitted_until = train_end
+        predictor = model if learner == 'forest' else model[1]
+        X_test = X[test_start:test_end] if learner == 'forest' else model[0].transform(X[test_start:test_end])
+        outcomes.append((number, seconds, rows.stop - rows.start, predictor.predict_proba(X_test)[:, 1]))
+    return outcomes
+
+def walk_forward(features, n_folds=10, min_train=None, train_size=None, learner='forest', warm_start=True,
+                 n_chains=1, n_jobs=None, trees=100, trees_per_fold=20, max_trees=None, max_depth=5, alpha=1e-4, seed=0,
+                 threshold=0.5, instrument=None):
+    # features as returned by build_features / cached_features. Returns a dict with the per-fold table
+    # (bounds, fit time, F1, AUC), the stitched out-of-sample predictions (proba, prediction, label, return,
+    # fold per test bar) and F1/AUC of the stitched series. predictions['prediction'] is a long/flat signal
+    # on the bar's mid price that can be fed to a backtester as it is
+    from sklearn.metrics import f1_score, roc_auc_score
+
+    if learner not in LEARNERS:
+        raise ValueError(f"learner must be one of {LEARNERS}, got {learner!r}")
+    X = features.drop(columns=NON_FEATURES).to_numpy(dtype=np.float64)
+    y = features['label'].to_numpy()
+    folds = make_folds(len(features), n_folds, min_train, train_size)
+    params = {
+        'trees': trees, 'trees_per_fold': trees_per_fold, 'max_trees': max_trees, 'max_depth': max_depth,
+        'alpha': alpha, 'seed': seed,
+    }
+    numbered = list(enumerate(folds))
+    if warm_start:
+        chains = [list(chain) for chain in np.array_split(np.arange(len(folds)), n_chains) if len(chain)]
+        chains = [[numbered[i] for i in chain] for chain in chains]
+    else:
+        chains = [[fold] for fold in numbered]
+    tasks = [(chain, learner, warm_start, params) for chain in chains]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(tasks))
+
+    with stage(instrument, 'q3.walk_forward'):
+        if n_jobs == 1:
+            WORKER.update(X=X, y=y)
+            try:
+                outcomes = [outcome for task in tasks for outcome in _run_chain(task)]
+            finally:
+                WORKER.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=(X, y)) as pool:
+                outcomes = [outcome for chain in pool.map(_run_chain, tasks) for outcome in chain]
+
+    index = features.index
+    rows = []
+    proba = np.empty(len(features))
+    fold_of = np.full(len(features), -1)
+    for number, seconds, fitted, fold_proba in sorted(outcomes, key=lambda item: item[0]):
+        train_start, train_end, test_start, test_end = folds[number]
+        proba[test_start:test_end] = fold_proba
+        fold_of[test_start:test_end] = number
+        y_test = y[test_start:test_end]
+        rows.append({
+            'fold': number,
+            'train_start': index[train_start],
+            'train_end': index[train_end - 1],
+            'test_start': index[test_start],
+            'test_end': index[test_end - 1],
+            'train_rows': train_end - train_start,
+            'fitted_rows': fitted,
+            'fit_seconds': seconds,
+            'f1': f1_score(y_test, fold_proba > threshold, zero_division=0),
+            'auc': _auc(roc_auc_score, y_test, fold_proba),
+        })
+
+    tested = slice(folds[0][2], folds[-1][3])
+    predictions = pd.DataFrame({
+        'proba': proba[tested],
+        'prediction': (proba[tested] > threshold).astype(np.int8),
+        'label': y[tested],
+        'return': features['return'].to_numpy()[tested],
+        'fold': fold_of[tested],
+    }, index=index[tested])
+    return {
+        'folds': pd.DataFrame(rows),
+        'predictions': predictions,
+        'metrics': {
+            'F1': f1_score(predictions['label'], predictions['prediction'], zero_division=0),
+            'AUC': _auc(roc_auc_score, predictions['label'], predictions['proba']),
+        },
+    }
+
+def _auc(roc_auc_score, y_true, proba):
+    # AUC is undefined when a test window holds one class only
+    return roc_auc_score(y_true, proba) if len(np.unique(y_true)) == 2 else np.nan
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else TICKS_PATH
+    features = cached_features(path)
+    result = walk_forward(features, n_folds=10)
+    print(result['folds'].to_string(index=False))
+    print(f"stitched F1: {result['metrics']['F1']:.4f}  AUC: {result['metrics']['AUC']:.4f}")
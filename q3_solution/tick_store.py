@@ -0,0 +1,157 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Compact columnar binary copy of the tick CSV so experiments do not re-parse text every time.
+# A store is a folder with one raw little-endian file per column plus meta.json:
+#   timestamp  int64 nanoseconds since epoch (UTC)
+#   *price*    float64 (or float32 with price_dtype)
+#   *size*     float32
+#   side       int8, 1 = buy, -1 = sell, 0 = anything else
+# Columns are opened with np.memmap, so slicing a time range is a binary search on the timestamp column
+# followed by zero-copy views.
+
+SIDE_CODES = {'buy': 1, 'sell': -1}
+SIDE_NAMES = ['sell', 'other', 'buy'] # indexed by code + 1
+
+def _column_dtype(name, price_dtype):
+    if name == 'timestamp':
+        return np.dtype('<i8')
+    if name == 'side':
+        return np.dtype('i1')
+    if 'price' in name:
+        return np.dtype(price_dtype).newbyteorder('<')
+    if 'size' in name:
+        return np.dtype('<f4')
+    return np.dtype('<f8')
+
+def convert_csv(csv_path, out_dir, chunksize=1_000_000, price_dtype='float64'):
+    os.makedirs(out_dir, exist_ok=True)
+    files = {}
+    dtypes = {}
+    rows = 0
+    last_stamp = None
+    is_sorted = True
+    tz = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            stamps = pd.to_datetime(chunk['timestamp'])
+            if stamps.dt.tz is not None:
+                tz = str(stamps.dt.tz)
+                stamps = stamps.dt.tz_convert('UTC').dt.tz_localize(None)
+            encoded = {'timestamp': stamps.to_numpy().astype('datetime64[ns]').view(np.int64)}
+            for name in chunk.columns:
+                if name == 'timestamp':
+                    continue
+                if name == 'side':
+                    encoded[name] = chunk[name].map(SIDE_CODES).fillna(0).to_numpy()
+                else:
+                    encoded[name] = chunk[name].to_numpy()
+            if not files:
+                for name in encoded:
+                    dtypes[name] = _column_dtype(name, price_dtype)
+                    files[name] = open(os.path.join(out_dir, name + '.bin'), 'wb')
+            stamps = encoded['timestamp']
+            if len(stamps):
+                if (last_stamp is not None and stamps[0] < last_stamp) or (np.diff(stamps) < 0).any():
+                    is_sorted = False
+                last_stamp = stamps[-1]
+            for name, values in encoded.items():
+                files[name].write(np.ascontiguousarray(values, dtype=dtypes[name]).tobytes())
+            rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta = {
+        'rows': rows,
+        'columns': {name: dtype.str for name, dtype in dtypes.items()},
+        'sorted': is_sorted,
+        'tz': tz,
+    }
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+    return TickStore(out_dir)
+
+class TickStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta['rows']
+        self.columns = {}
+        for name, dtype in self.meta['columns'].items():
+            if self.rows == 0:
+                self.columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r', shape=(self.rows,))
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def timestamp(self):
+        return self.columns['timestamp']
+
+    def _to_ns(self, when):
+        when = pd.Timestamp(when)
+        if when.tz is not None:
+            when = when.tz_convert('UTC').tz_localize(None)
+        elif self.meta.get('tz'):
+            when = when.tz_localize(self.meta['tz']).tz_convert('UTC').tz_localize(None)
+        return when.value
+
+    def locate(self, start=None, end=None):
+        # row range [lo, hi) of the ticks with start <= timestamp < end
+        if not self.meta['sorted']:
+            raise ValueError(f"{self.path} is not sorted by timestamp, time slicing needs sorted ticks")
+        lo = 0 if start is None else int(np.searchsorted(self.timestamp, self._to_ns(start), side='left'))
+        hi = self.rows if end is None else int(np.searchsorted(self.timestamp, self._to_ns(end), side='left'))
+        return lo, max(lo, hi)
+
+    def slice(self, start=None, end=None):
+        # zero-copy views of every column for the time range
+        lo, hi = self.locate(start, end)
+        return {name: column[lo:hi] for name, column in self.columns.items()}
+
+    def rows_to_frame(self, lo, hi):
+        # tick frame in the schema q3 expects, this is the point where the data gets copied
+        stamps = pd.DatetimeIndex(np.asarray(self.timestamp[lo:hi]).view('datetime64[ns]'), name='timestamp')
+        if self.meta.get('tz'):
+            stamps = stamps.tz_localize('UTC').tz_convert(self.meta['tz'])
+        data = {}
+        for name, column in self.columns.items():
+            if name == 'timestamp':
+                continue
+            if name == 'side':
+                data[name] = pd.Categorical.from_codes(np.asarray(column[lo:hi], dtype=np.int8) + 1, categories=SIDE_NAMES)
+            else:
+                data[name] = np.asarray(column[lo:hi])
+        return pd.DataFrame(data, index=stamps)
+
+    def to_frame(self, start=None, end=None):
+        return self.rows_to_frame(*self.locate(start, end))
+
+    def iter_frames(self, chunksize=1_000_000):
+        for lo in range(0, self.rows, chunksize):
+            yield self.rows_to_frame(lo, min(lo + chunksize, self.rows))
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'ethusdt_ticks.csv'
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(csv_path)[0] + '_store'
+    start = time.perf_counter()
+    store = convert_csv(csv_path, out_dir)
+    print(f"converted {len(store):,} ticks to {out_dir} in {time.perf_counter() - start:.2f}s")
+    if len(store):
+        first = pd.Timestamp(int(store.timestamp[0]))
+        start = time.perf_counter()
+        hour = store.to_frame(first, first + pd.Timedelta('1h'))
+        print(f"loaded {len(hour):,} ticks of the first hour in {(time.perf_counter() - start) * 1e3:.1f}ms")
@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for folder in ('q1_solution', 'creating_a_basic_model'):
+    sys.path.insert(0, os.path.join(HERE, folder))
+
+# Batch runner for the daily strategies: every (strategy, ticker) pair is backtested on the cached prices
+# (price_cache.py) and its metrics go to one CSV or Parquet table, one row per run.
+# Only the standard library is imported at start up. pandas and the strategy modules are imported by the
+# workers when the first task runs, matplotlib is never imported (the scripts only import it to plot) and
+# yfinance only when price_cache has to download. Tickers run concurrently in a process pool, every task
+# loads its prices once and runs all strategies on them.
+#
+# Strategies and their parameters (keyword arguments of the strategy function):
+#   sma_crossover   short, long              momentum_bollinger_pairTrading, calculate_metrics
+#   momentum        lookback
+#   bollinger       window, num_std
+#   pair            z_thresh, hedge_ratio    runs on --pairs A:B instead of the tickers
+#   sma             short_window, long_window   moving_average.apply_sma_crossover_strategy
+#   mean_reversion  MeanReversionBacktester arguments, metrics from evaluate_performance
+#
+# Both metric sets are written under one schema (METRIC_COLUMNS), drawdowns and returns as fractions, with NaN
+# where a strategy does not report a metric. mean_reversion sizes positions on a volatility annualised for one
+# minute bars (sqrt(252 * 390)), its rows get a warning column when the prices are spaced further apart, as the
+# daily yfinance bars of the price cache are.
+#
+#   python run_batch.py --strategy bollinger --strategy momentum --tickers AAPL MSFT NVDA --output metrics.csv
+#   python run_batch.py --config batch.json        # same keys as the arguments, arguments win
+#   python run_batch.py --strategy bollinger --param bollinger.window=30 --tickers AAPL --offline
+#
+# A config file is JSON (or TOML with a .toml extension), e.g.
+#   {"tickers": ["AAPL", "MSFT"], "pairs": ["AAPL:MSFT"], "start": "2023-01-01", "capital": 10000,
+#    "strategies": {"bollinger": {"window": 20, "num_std": 2}, "pair": {}}, "output": "metrics.parquet", "jobs": 4}
+
+STRATEGIES = ('sma_crossover', 'momentum', 'bollinger', 'pair', 'sma', 'mean_reversion')
+METRIC_COLUMNS = ('sharpe', 'max_drawdown', 'cagr', 'turnover', 'hit_rate', 'final_value', 'total_return')
+METRIC_KEYS = { # key of calculate_metrics or evaluate_performance: (column, factor to the column's unit)
+    'Sharpe Ratio': ('sharpe', 1), 'Max Drawdown (%)': ('max_drawdown', 0.01), 'Final Value': ('final_value', 1),
+    'Total Return (%)': ('total_return', 0.01),
+    'Sharpe': ('sharpe', 1), 'Max Drawdown': ('max_drawdown', 1), 'CAGR': ('cagr', 1), 'Turnover': ('turnover', 1),
+    'Hit Rate': ('hit_rate', 1),
+}
+DEFAULTS = {
+    'tickers': [], 'pairs': [], 'start': '2023-01-01', 'end': None, 'capital': 10000.0, 'strategies': {},
+    'output': 'metrics.csv', 'jobs': None, 'offline': False,
+}
+
+def load_config(path):
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+def parse_value(text):
+    # numbers and booleans in --param values, anything else stays a string
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def settings_from(args):
+    settings = dict(DEFAULTS)
+    if args.config:
+        settings.update(load_config(args.config))
+    strategies = {name: dict(params or {}) for name, params in settings['strategies'].items()}
+    for name in args.strategy or []:
+        strategies.setdefault(name, {})
+    for assignment in args.param or []:
+        key, _, value = assignment.partition('=')
+        name, _, param = key.partition('.')
+        if name not in STRATEGIES or not param:
+            raise SystemExit(f"--param expects strategy.name=value, got {assignment!r}")
+        strategies.setdefault(name, {})[param] = parse_value(value)
+    unknown = set(strategies).difference(STRATEGIES)
+    if unknown:
+        raise SystemExit(f"unknown strategies {sorted(unknown)}, choose from {list(STRATEGIES)}")
+    settings['strategies'] = strategies
+    for key in ('tickers', 'pairs', 'start', 'end', 'capital', 'output', 'jobs'):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    settings['offline'] = settings['offline'] or args.offline
+    return settings
+
+def make_tasks(settings):
+    # one task per ticker (all single ticker strategies) and one per pair
+    single = {name: params for name, params in settings['strategies'].items() if name != 'pair'}
+    tasks = []
+    if single:
+        tasks += [((ticker,), single) for ticker in settings['tickers']]
+    if 'pair' in settings['strategies']:
+        for pair in settings['pairs']:
+            first, _, second = pair.partition(':')
+            if not second:
+                raise SystemExit(f"pairs are written A:B, got {pair!r}")
+            tasks.append(((first, second), {'pair': settings['strategies']['pair']}))
+    common = {key: settings[key] for key in ('start', 'end', 'capital', 'offline')}
+    return [(tickers, strategies, common) for tickers, strategies in tasks]
+
+def to_schema(metrics):
+    # metrics of either engine under METRIC_COLUMNS
+    row = dict.fromkeys(METRIC_COLUMNS, float('nan'))
+    for key, value in metrics.items():
+        column, factor = METRIC_KEYS[key]
+        row[column] = float(value) * factor
+    return row
+
+def run_strategy(name, frames, params, capital):
+    # metrics of one backtest under METRIC_COLUMNS, plus a warning when its numbers are known to be off
+    if name == 'mean_reversion':
+        import pandas as pd
+        from q1 import MeanReversionBacktester
+        bars = frames[0].rename(columns=str.lower)
+        bt = MeanReversionBacktester(bars, **dict({'capital': capital}, **params))
+        bt.run()
+        row = to_schema(bt.evaluate_performance(plot=False, verbose=False))
+        if len(bt.data):
+            row['final_value'] = float(bt.data['portfolio'].iloc[-1])
+            row['total_return'] = row['final_value'] / capital - 1
+        spacing = bars.index.to_series().diff().median()
+        if spacing > pd.Timedelta(minutes=1):
+            row['warning'] = (
+                f"volatility annualised as one minute bars (sqrt(252 * 390)) on bars {spacing} apart, "
+                "position sizes and volatility are off"
+            )
+        return row
+    from momentum_bollinger_pairTrading import (
+        backtest_strategy, bollinger_strategy, calculate_metrics, momentum_strategy, pair_trading_strategy, sma_crossover
+    )
+    if name == 'sma':
+        from moving_average import apply_sma_crossover_strategy
+        data = apply_sma_crossover_strategy(frames[0], params.get('short_window', 20), params.get('long_window', 50))
+    elif name == 'pair':
+        data = pair_trading_strategy(frames[0], frames[1], **params)
+    else:
+        strategy = {'sma_crossover': sma_crossover, 'momentum': momentum_strategy, 'bollinger': bollinger_strategy}[name]
+        data = strategy(frames[0], **params)
+    if data.empty:
+        raise ValueError("no bars left after the strategy's warm-up")
+    return to_schema(calculate_metrics(backtest_strategy(data, capital)))
+
+def run_task(task):
+    # list of result rows, failures are reported in the error column instead of stopping the batch
+    import contextlib
+    import datetime
+    import io
+    import warnings
+
+    from price_cache import load_prices
+
+    tickers, strategies, common = task
+    label = ':'.join(tickers)
+    end = common['end'] or datetime.date.today().strftime("%Y-%m-%d")
+    rows = []
+    try:
+        frames = [load_prices(ticker, common['start'], end, offline=common['offline']) for ticker in tickers]
+        missing = [ticker for ticker, frame in zip(tickers, frames) if frame is None or frame.empty]
+        if missing:
+            raise ValueError(f"no prices for {', '.join(missing)}")
+    except Exception as e:
+        return [
+            {'strategy': name, 'ticker': label, 'params': json.dumps(params, sort_keys=True), 'error': str(e)}
+            for name, params in strategies.items()
+        ]
+    for name, params in strategies.items():
+        row = {'strategy': name, 'ticker': label, 'params': json.dumps(params, sort_keys=True)}
+        start = time.perf_counter()
+        try:
+            # the strategy functions print progress, and metrics of runs that never trade warn about 0/0
+            with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                row.update(run_strategy(name, frames, params, common['capital']))
+        except Exception as e:
+            row['error'] = f"{type(e).__name__}: {e}"
+        row['seconds'] = time.perf_counter() - start
+        rows.append(row)
+    return rows
+
+def run(tasks, jobs=None):
+    jobs = min(jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    if jobs == 1:
+        return [row for task in tasks for row in run_task(task)]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return [row for rows in pool.map(run_task, tasks) for row in rows]
+
+def check_output(path):
+    # fails before any backtest runs when the table could not be written
+    import importlib.util
+    if path.endswith('.parquet') and not any(importlib.util.find_spec(name) for name in ('pyarrow', 'fastparquet')):
+        raise SystemExit("writing .parquet needs pyarrow or fastparquet, use a .csv output or install one")
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(folder):
+        raise SystemExit(f"output folder {folder} does not exist")
+
+def write_table(rows, path):
+    import pandas as pd
+    table = pd.DataFrame(rows)
+    if path.endswith('.parquet'):
+        table.to_parquet(path, index=False) # needs pyarrow or fastparquet
+    else:
+        table.to_csv(path, index=False)
+    return table
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', help='JSON or TOML file with the settings below')
+    parser.add_argument('--strategy', choices=STRATEGIES, action='append')
+    parser.add_argument('--param', action='append', help='strategy.name=value, e.g. bollinger.window=30')
+    parser.add_argument('--tickers', nargs='+')
+    parser.add_argument('--pairs', nargs='+', help='A:B ticker pairs for the pair strategy')
+    parser.add_argument('--start')
+    parser.add_argument('--end', help='default: today')
+    parser.add_argument('--capital', type=float)
+    parser.add_argument('--output', help='.csv or .parquet')
+    parser.add_argument('--jobs', type=int, help='worker processes, default: one per CPU')
+    parser.add_argument('--offline', action='store_true', help='only use prices already in the price cache')
+    args = parser.parse_args()
+
+    settings = settings_from(args)
+    tasks = make_tasks(settings)
+    if not tasks:
+        parser.error("nothing to run, give strategies and tickers (or pairs)")
+    check_output(settings['output'])
+    start = time.perf_counter()
+    rows = run(tasks, settings['jobs'])
+    table = write_table(rows, settings['output'])
+    failed = int(table['error'].notna().sum()) if 'error' in table else 0
+    warned = int(table['warning'].notna().sum()) if 'warning' in table else 0
+    print(
+        f"{len(table)} runs ({failed} failed, {warned} with a warning) in {time.perf_counter() - start:.2f}s, "
+        f"metrics written to {settings['output']}"
+    )